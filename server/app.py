@@ -1,27 +1,46 @@
 import os
+import asyncio
 import atexit
-import base64
+import binascii
+import io
 import cv2
+import gzip
+import hashlib
+import httpx
 import numpy as np
+import queue
 import re
 import random
 import smtplib
 import ssl
+import threading
 import time
-from datetime import date, datetime, timedelta
+from string import Template
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
 from email.message import EmailMessage
+from functools import lru_cache, wraps
 from pathlib import Path
+from zoneinfo import ZoneInfo
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from dotenv import load_dotenv
 from deepface import DeepFace
-from flask import Flask, jsonify, render_template, request, send_from_directory
+from deepface.modules import detection, verification
+# After deepface, which sets TF_USE_LEGACY_KERAS before TensorFlow is first imported
+import tensorflow as tf
+from flask import Flask, Response, jsonify, render_template, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from gotrue.errors import AuthApiError
-from pytz import timezone
+from gotrue.http_clients import SyncClient
+from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
 from supabase import create_client
 from concurrent.futures import ThreadPoolExecutor
 
 from itsdangerous import URLSafeTimedSerializer
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Load environment variables from the .env file
 env_path = Path('.') / '.env'
@@ -29,10 +48,60 @@ load_dotenv(dotenv_path=env_path)
 
 print("--- Server starting up ---")
 
+class AppJSONProvider(DefaultJSONProvider):
+    """
+    Encodes responses without sorting keys, pretty-printing or escaping non-ASCII
+    text, and accepts numpy arrays and scalars (e.g. face embeddings) directly.
+    """
+    sort_keys = False
+    compact = True
+    ensure_ascii = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        return DefaultJSONProvider.default(o)
+
+
 #  Initialize the Flask application
 app = Flask(__name__, static_folder='static', template_folder='templates')
+app.json = AppJSONProvider(app)
+# Uploads past 500KB are spooled to disk by Werkzeug; this caps what it accepts
+app.config['MAX_CONTENT_LENGTH'] = int(
+    os.environ.get("MAX_UPLOAD_MB", "50")) * 1024 * 1024
 app.secret_key = os.environ.get("FLASK_SECRET_KEY")
 
+# Templates only change on deploy: keep compiled ones in memory and on disk
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR", "/tmp/jinja_cache")
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.auto_reload = False
+app.jinja_env.cache_size = 400
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+# JSON bodies at least this large are gzipped for clients that accept it
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 4
+
+
+@app.after_request
+def compress_json_response(response):
+    """Gzips large JSON responses, e.g. dashboard records and apology lists."""
+    if response.mimetype != 'application/json' or response.direct_passthrough:
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'Content-Encoding' in response.headers or not request.accept_encodings['gzip']:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 # Configure Supabase clients for database and auth operations
 url: str = os.environ.get("SUPABASE_URL")
 anon_key: str = os.environ.get("SUPABASE_KEY")
@@ -41,6 +110,58 @@ service_key: str = os.environ.get("SUPABASE_SERVICE_KEY")
 supabase_anon = create_client(url, anon_key)
 supabase_admin = create_client(url, service_key)  # For server-side admin
 
+# Keep Supabase connections open between requests and scheduler ticks instead of
+# letting httpx drop them after its default five idle seconds
+SUPABASE_HTTP_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=50, keepalive_expiry=120)
+# Fail fast when Supabase is unreachable instead of waiting out the read timeout
+SUPABASE_CONNECT_TIMEOUT = 3.0
+
+# GoTrue sends absolute URLs and per-request headers, so both clients' auth APIs
+# (a token check on nearly every request) can share one HTTP/2 connection pool
+supabase_auth_http = SyncClient(
+    http2=True, follow_redirects=True, limits=SUPABASE_HTTP_LIMITS,
+    timeout=httpx.Timeout(10.0, connect=SUPABASE_CONNECT_TIMEOUT))
+for _client in (supabase_anon, supabase_admin):
+    _client.auth._http_client.close()
+    _client.auth._http_client = supabase_auth_http
+    _client.auth.admin._http_client = supabase_auth_http
+
+
+def _pooled_session(session):
+    """Rebuilds a PostgREST or Storage httpx session with the shared pool limits, keeping its URL and headers."""
+    pooled = httpx.Client(base_url=session.base_url, headers=session.headers,
+                          timeout=httpx.Timeout(
+                              session.timeout.read, connect=SUPABASE_CONNECT_TIMEOUT),
+                          follow_redirects=True, http2=True,
+                          limits=SUPABASE_HTTP_LIMITS)
+    session.close()
+    return pooled
+
+
+# PostgREST and Storage rewrite the base URL and headers of whatever client they
+# are given, so each keeps a session of its own. Only the admin client queries the
+# database and storage, and it never signs in, so these are not rebuilt behind our back.
+supabase_admin.postgrest.session = _pooled_session(
+    supabase_admin.postgrest.session)
+supabase_admin.storage.session = supabase_admin.storage._client = _pooled_session(
+    supabase_admin.storage.session)
+
+
+def _close_supabase_http():
+    supabase_auth_http.close()
+    supabase_admin.postgrest.session.close()
+    supabase_admin.storage.session.close()
+
+
+atexit.register(_close_supabase_http)
+
+# Open the auth connection now so the first request doesn't pay for the TLS handshake
+try:
+    supabase_auth_http.get(f"{url}/auth/v1/health", headers={'apikey': anon_key})
+except Exception as e:
+    print(f"Could not pre-warm the Supabase auth connection: {e}")
+
 
 campaign_serializer = URLSafeTimedSerializer(
     app.secret_key, salt='campaign-token')
@@ -48,48 +169,343 @@ campaign_serializer = URLSafeTimedSerializer(
 # Load email credentials for the notification system
 EMAIL_SENDER = os.environ.get("EMAIL_SENDER_ADDRESS")
 EMAIL_PASSWORD = os.environ.get("EMAIL_SENDER_PASSWORD")
+SMTP_HOST = 'smtp.gmail.com'
+SMTP_PORT = 465
+# Gmail only allows a handful of simultaneous SMTP connections per account
+SMTP_MAX_CONNECTIONS = 5
+# Minimum gap between two sends on the same connection, to stay under Gmail's rate limits
+EMAIL_SEND_INTERVAL = float(os.environ.get("EMAIL_SEND_INTERVAL", "0.1"))
+
+# Lecture guide entries look like "Week 3 (2025-08-14): Topic"; [ \t]* keeps a
+# match from running onto the next line when the whole file is scanned at once
+SCHEDULE_PATTERN = re.compile(r"\((\d{4}-\d{2}-\d{2})\):[ \t]*(.*)")
+# A campaign incentive like "WiFi Pass x3" has three winners
+WINNERS_PATTERN = re.compile(r"x(\d+)")
+
+# EMAIL TEMPLATES
+# Parsed once at import; each send only substitutes the per-recipient values.
+
+# At-risk warnings by absence threshold: (subject, body)
+AT_RISK_TEMPLATES = {
+    16: (
+        Template("Check-in: We miss you in $module_code"),
+        Template(
+            "Hi $student_name,\n\n"
+            "I wanted to reach out because I've noticed you've missed $total_absences classes in $module_code so far this semester.\n\n"
+            "Your current attendance puts you at $current_mark% for the module. You've dropped slightly below our 70% target, but you're still above the 60% pass threshold. However, if you miss 5 more classes, your mark will drop below 60% and you'll be at risk of failing.\n\n"
+            "I believe in your ability to succeed, and I'm here to support you. If there's anything affecting your attendance - whether it's personal challenges, academic struggles, or anything else - please don't hesitate to reach out to me.\n\n"
+            "You can also contact DUT Student Counselling confidentially at: counselling@dut.ac.za\n\n"
+            "Let's work together to get you back on track.\n\n"
+            "Best regards,\n$lecturer_name"
+        )
+    ),
+    18: (
+        Template("Urgent: Your attendance in $module_code needs attention"),
+        Template(
+            "Hi $student_name,\n\n"
+            "This is an important message about your progress in $module_code.\n\n"
+            "You have now missed $total_absences classes, which means your current mark is $current_mark%. You are very close to falling below the 60% pass threshold.\n\n"
+            "If you miss just 3 more classes, you will fail the module. I'm reaching out because I want to help you avoid this outcome.\n\n"
+            "Please consider this a serious warning. I strongly encourage you to:\n"
+            "- Attend all remaining classes\n"
+            "- Meet with me to discuss any challenges you're facing\n"
+            "- Reach out to Student Counselling if you need support: counselling@dut.ac.za\n\n"
+            "It's not too late to turn things around, but you need to act now.\n\n"
+            "Sincerely,\n$lecturer_name"
+        )
+    ),
+    21: (
+        Template("CRITICAL: You are at risk of failing $module_code"),
+        Template(
+            "Hi $student_name,\n\n"
+            "This is a critical notice regarding your enrollment in $module_code.\n\n"
+            "You have missed $total_absences classes, which means your current mark is $current_mark% - below the 60% pass threshold. You are now at risk of failing this module.\n\n"
+            "This is an urgent situation that requires immediate action. I need you to:\n\n"
+            "1. Contact me immediately to discuss your situation\n"
+            "2. Attend every remaining class without exception\n"
+            "3. Consider whether you may qualify for special consideration (illness, family emergency, etc.)\n\n"
+            "If you're facing serious challenges that have affected your attendance, you may be able to submit a special consideration request through the system. Please reach out to me or Student Counselling (counselling@dut.ac.za) for guidance.\n\n"
+            "I want to help you succeed, but you must take action now.\n\n"
+            "Urgent regards,\n$lecturer_name"
+        )
+    ),
+}
+
+DAILY_ABSENCE_TEMPLATE = (
+    Template("Catch-up for $module_code"),
+    Template(
+        "Hi $student_name,\n\n"
+        "I noticed you weren't in our class today. We covered the topic: '$topic'.\n\n"
+        "Please take some time to review the material. If you have any questions, please don't hesitate to reach out.\n\n"
+        "Best regards,\n$lecturer_name"
+    )
+)
+
+DECISION_SUBJECT_TEMPLATE = Template("Update on your submission for $assessment")
+DECISION_BODY_TEMPLATES = {
+    'Approved': Template(
+        "Hi $student_name,\n\n"
+        "Good news! Your special consideration request for '$assessment' has been approved.\n\n"
+        "Reason: $reason\n\n"
+        "I will be in touch with you shortly regarding the arrangements for your supplementary assessment.\n\n"
+        "Best regards,\n$lecturer_name"
+    ),
+    'Rejected': Template(
+        "Hi $student_name,\n\n"
+        "This email is to inform you that your special consideration request for '$assessment' has been rejected.\n\n"
+        "Reason: $reason\n\n"
+        "If you would like to discuss this further, please do not hesitate to contact me.\n\n"
+        "Sincerely,\n$lecturer_name"
+    ),
+}
 
-# Pre-load and warm-up the AI model with SSD backend
-print("Warming up face recognition model (VGG-Face with SSD)...")
+PERFECT_ATTENDANCE_TEMPLATE = (
+    Template("Great work in $module_code last week!"),
+    Template(
+        "Hi $student_name,\n\n"
+        "Well done! My records show you attended all our $module_code classes last week. "
+        "Your commitment is fantastic to see.\n\n"
+        "Keep up the great work!\n\n"
+        "Best regards,\n$lecturer_name"
+    )
+)
+
+ZERO_ATTENDANCE_TEMPLATE = (
+    Template("Checking in regarding $module_code"),
+    Template(
+        "Hi $student_name,\n\n"
+        "I noticed you were not in any of our $module_code classes last week "
+        "and wanted to check in.\n\n"
+        "We miss you in class. If you are facing any challenges, please know you don't have to go through them alone. "
+        "You can reply to this email to talk to me, or confidentially reach out to DUT Student Counselling for support at: counselling@dut.ac.za\n\n"
+        "I am here to help you succeed, so please let me know if there's anything I can do.\n\n"
+        "Sincerely,\n$lecturer_name"
+    )
+)
+
+# Campaign invitations by campaign_type: (subject, body)
+CAMPAIGN_TEMPLATES = {
+    'WEEKLY_QUIZ': (
+        Template("Weekly Progress Quiz is Ready! ($title)"),
+        Template(
+            "Hi $student_name,\n\n"
+            "The weekly progress quiz is now available. Please use the unique link below to respond:\n\n"
+            "Link: $response_link\n\n"
+            "Complete the quiz for a chance to win an '$incentive'.\n\n"
+            "Good luck!\nYour Lecturer"
+        )
+    ),
+    'FEEDBACK_SURVEY': (
+        Template("Your Feedback is Important - Anonymous Survey"),
+        Template(
+            "Hi $student_name,\n\n"
+            "Please take a moment to provide anonymous feedback on the module using the secure link below:\n\n"
+            "Link: $response_link\n\n"
+            "You'll be entered into a draw to win a '$incentive'.\n\n"
+            "Thank you,\nYour Lecturer"
+        )
+    ),
+}
+
+# Winner emails and voucher type, picked by the first key found in the incentive
+WINNER_TEMPLATES = {
+    'Assignment Extension': (
+        Template("🎉 Congratulations! You've won an Assignment Extension Voucher!"),
+        Template(
+            "Hi $student_name,\n\n"
+            "Great news! For completing the '$title', you've been randomly selected to receive an Assignment Extension Voucher.\n\n"
+            "This voucher grants you a 24-hour extension on a single assignment. To redeem it, please forward this email to me when you submit.\n\n"
+            "Well done and thank you for your participation!\nYour Lecturer"
+        ),
+        "Assignment Extension"
+    ),
+    'WiFi Pass': (
+        Template("🎉 Congratulations! You've won a Staff WiFi Pass!"),
+        Template(
+            "Hi $student_name,\n\n"
+            "Great news! For completing the '$title', you've been randomly selected to receive a one-month DUT Staff WiFi Pass.\n\n"
+            "Please see me after our next class to collect your pass.\n\n"
+            "Thank you for your valuable feedback!\nYour Lecturer"
+        ),
+        "Staff WiFi Pass"
+    ),
+}
+GENERIC_WINNER_TEMPLATE = (
+    Template("Congratulations! You're a campaign winner!"),
+    Template("Hi $student_name, You have won the prize for the '$title' campaign."),
+    "Generic Prize"
+)
+
+# Let TensorFlow use every CPU core and only claim GPU memory as it needs it.
+# This has to happen before the first model is built.
 try:
-    # Creates a dummy image to pass through the model on startup.
-    dummy_image = np.zeros((160, 160, 3), dtype=np.uint8)
-    DeepFace.represent(dummy_image, model_name="VGG-Face",
-                       detector_backend="ssd", enforce_detection=False)
-    print("Face recognition model warmed up successfully.")
-except Exception as e:
-    print(f"Error during model warmup: {str(e)}")
+    tf.config.threading.set_intra_op_parallelism_threads(os.cpu_count())
+    gpus = tf.config.list_physical_devices('GPU')
+    for gpu in gpus:
+        tf.config.experimental.set_memory_growth(gpu, True)
+    if gpus and os.environ.get("FACE_MODEL_FP16") == "1":
+        # Half precision runs on tensor cores but shifts embeddings slightly, so it is opt-in
+        tf.keras.mixed_precision.set_global_policy('mixed_float16')
+    print(f"TensorFlow using {len(gpus)} GPU(s) and {os.cpu_count()} CPU threads")
+except RuntimeError as e:
+    print(f"Could not configure TensorFlow devices: {e}")
+
+# Shared worker pool for fanning out Supabase queries from scheduled jobs.
+# SMTP sends keep their own pool, capped at SMTP_MAX_CONNECTIONS.
+APP_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='app-worker')
+atexit.register(APP_EXECUTOR.shutdown)
+
+# Build the recognition model and face detector once; requests only run inference
+print("Loading face recognition model (VGG-Face) and SSD detector...")
+vgg_model = DeepFace.build_model("VGG-Face")
+ssd_detector = DeepFace.build_model("ssd", task="face_detector")
+
+
+# Trace the VGG-Face forward pass once as a graph for any batch size. XLA fuses the
+# conv/bias/relu kernels; set FACE_MODEL_XLA=0 to fall back to a plain graph.
+@tf.function(
+    input_signature=[tf.TensorSpec(
+        (None, *vgg_model.input_shape, 3), tf.float32)],
+    jit_compile=os.environ.get("FACE_MODEL_XLA", "1") == "1")
+def _vgg_infer(batch):
+    return vgg_model.model(batch, training=False)
+
+
+def ttl_cache(seconds, maxsize=128):
+    """
+    lru_cache whose entries expire every `seconds`: the current time.monotonic()
+    bucket is part of the cache key, so a new bucket means a fresh lookup.
+    """
+    def decorator(func):
+        @lru_cache(maxsize=maxsize)
+        def cached(bucket, *args, **kwargs):
+            return func(*args, **kwargs)
 
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return cached(int(time.monotonic() // seconds), *args, **kwargs)
+
+        wrapper.cache_clear = cached.cache_clear
+        return wrapper
+    return decorator
+
+
+def paged(build_query, page=1000):
+    """
+    Yields the rows of a Supabase query one page at a time via .range(), so large
+    result sets are never held in a single response. `build_query` must return a
+    fresh, stably ordered query builder on every call.
+    """
+    offset = 0
+    while True:
+        rows = build_query().range(offset, offset + page - 1).execute().data or []
+        yield from rows
+        if len(rows) < page:
+            return
+        offset += page
+
+
+def with_retries(func, attempts=5, base_delay=0.05, max_delay=1.0):
+    """
+    Calls func() until it returns something truthy, waiting 50ms, 100ms, 200ms...
+    (capped at max_delay) between attempts. Raises the last error once attempts
+    run out.
+    """
+    for attempt in range(attempts):
+        try:
+            result = func()
+            if result:
+                return result
+            error = RuntimeError("Call returned no data")
+        except Exception as e:
+            error = e
+        if attempt < attempts - 1:
+            time.sleep(min(max_delay, base_delay * 2 ** attempt))
+    raise error
+
+
+SAST = ZoneInfo('Africa/Johannesburg')
 
 # TIME MACHINE: Global cache and helper function for time control
 system_time_settings = {
     'override_enabled': False,
     'simulated_start_time': None,
-    'real_time_at_set': None,
-    'last_checked': None
+    'real_time_at_set': None
 }
 
 
+# True while the realtime subscription below is live; get_system_time only polls
+# system_settings when it is not
+settings_stream_live = threading.Event()
+
+
+@ttl_cache(seconds=10)
+def _fetch_system_settings():
+    res = supabase_admin.table('system_settings').select(
+        'override_enabled, simulated_datetime').eq('id', 1).single().execute()
+    return res.data
+
+
+def _apply_system_settings(settings, real_now):
+    new_override_status = settings['override_enabled']
+    sim_dt_str = settings.get('simulated_datetime')
+    new_sim_time = datetime.fromisoformat(
+        sim_dt_str) if sim_dt_str else None
+
+    if system_time_settings['simulated_start_time'] != new_sim_time or system_time_settings['override_enabled'] != new_override_status:
+        system_time_settings['simulated_start_time'] = new_sim_time
+        system_time_settings['real_time_at_set'] = real_now
+
+    system_time_settings['override_enabled'] = new_override_status
+
+
+def _on_settings_change(payload):
+    record = payload['data'].get('record')
+    if record and record.get('id') == 1:
+        _apply_system_settings(record, datetime.now(SAST))
+        # The clock may have jumped, so re-plan scheduled work
+        try:
+            reschedule_after_clock_change()
+        except Exception as e:
+            print(f"--- ERROR rescheduling after a clock change: {str(e)} ---")
+
+
+def _on_settings_subscribe(state, error):
+    if state == RealtimeSubscribeStates.SUBSCRIBED:
+        print("Subscribed to system_settings changes.")
+        settings_stream_live.set()
+    else:
+        print(
+            f"system_settings subscription {state}: {error}. Falling back to polling.")
+        settings_stream_live.clear()
+
+
+async def _listen_for_settings_changes():
+    client = AsyncRealtimeClient(f"{url}/realtime/v1", token=service_key)
+    await client.connect()
+    channel = client.channel('system_settings')
+    channel.on_postgres_changes(
+        'UPDATE', _on_settings_change, table='system_settings', schema='public')
+    await channel.subscribe(_on_settings_subscribe)
+    await asyncio.Future()  # keep the loop, and with it the websocket, running
+
+
+def _run_settings_listener():
+    try:
+        asyncio.run(_listen_for_settings_changes())
+    except Exception as e:
+        print(f"system_settings realtime listener stopped: {e}")
+    settings_stream_live.clear()
+
+
 def get_system_time():
-    sast = timezone('Africa/Johannesburg')
-    real_now = datetime.now(sast)
+    real_now = datetime.now(SAST)
 
-    if not system_time_settings['last_checked'] or (real_now - system_time_settings['last_checked']).seconds > 10:
+    if not settings_stream_live.is_set():
         try:
-            res = supabase_admin.table('system_settings').select(
-                '*').eq('id', 1).single().execute()
-            if res.data:
-                new_override_status = res.data['override_enabled']
-                sim_dt_str = res.data.get('simulated_datetime')
-                new_sim_time = datetime.fromisoformat(
-                    sim_dt_str) if sim_dt_str else None
-
-                if system_time_settings['simulated_start_time'] != new_sim_time or system_time_settings['override_enabled'] != new_override_status:
-                    system_time_settings['simulated_start_time'] = new_sim_time
-                    system_time_settings['real_time_at_set'] = real_now
-
-                system_time_settings['override_enabled'] = new_override_status
-            system_time_settings['last_checked'] = real_now
+            settings = _fetch_system_settings()
+            if settings:
+                _apply_system_settings(settings, real_now)
         except Exception as e:
             print(
                 f"TIME_OVERRIDE_ERROR: Could not fetch settings. Defaulting to real time. {e}")
@@ -98,36 +514,157 @@ def get_system_time():
     if system_time_settings['override_enabled'] and system_time_settings['simulated_start_time'] and system_time_settings['real_time_at_set']:
         real_time_elapsed = real_now - system_time_settings['real_time_at_set']
         utc_sim_start = system_time_settings['simulated_start_time']
-        sast_sim_start = utc_sim_start.astimezone(sast)
+        sast_sim_start = utc_sim_start.astimezone(SAST)
         current_simulated_time = sast_sim_start + real_time_elapsed
         return current_simulated_time
 
     return real_now
+
+
+# Load the current settings once; the realtime listener that follows changes is
+# started after the scheduler, at the bottom of this file
+get_system_time()
 # END TIME MACHINE SECTION
 
 # HELPER FUNCTIONS
 
 
-def get_face_embedding(image: np.ndarray) -> list:
+# SSD only reports faces at or above this score; the whole-frame fallback it
+# returns when nothing is found scores 0
+FACE_MIN_CONFIDENCE = 0.9
+
+
+def _extract_face(image: np.ndarray):
+    """
+    Runs SSD once and returns the largest face as an aligned BGR uint8 crop,
+    or None when no face was confidently detected.
+    """
     try:
-        # First try with strict detection
-        embedding_objs = DeepFace.represent(
-            img_path=image, model_name="VGG-Face", detector_backend="ssd",
-            enforce_detection=True, align=True
+        face_objs = detection.extract_faces(
+            img_path=image, detector_backend="ssd", enforce_detection=False,
+            align=True, color_face="bgr", normalize_face=False
         )
-        return embedding_objs[0]["embedding"] if embedding_objs else None
     except Exception as e:
-        print(f"Strict face detection failed: {e}")
-        try:
-            # Fallback with relaxed detection
-            embedding_objs = DeepFace.represent(
-                img_path=image, model_name="VGG-Face", detector_backend="ssd",
-                enforce_detection=False, align=True
-            )
-            return embedding_objs[0]["embedding"] if embedding_objs else None
-        except Exception as e2:
-            print(f"Relaxed face detection also failed: {e2}")
-            return None
+        print(f"Face detection failed: {e}")
+        return None
+    if not face_objs:
+        return None
+    face_obj = max(face_objs, key=lambda f: f["facial_area"]["w"] * f["facial_area"]["h"])
+    if face_obj["confidence"] < FACE_MIN_CONFIDENCE:
+        return None
+    return face_obj["face"]
+
+
+def _letterbox_into(face: np.ndarray, out: np.ndarray):
+    """
+    Scales a face crop into `out` (a zeroed float32 model-input slot) keeping its
+    aspect ratio, centred on black padding and scaled to [0, 1]. This is the same
+    transform as DeepFace's resize_image, so embeddings stay comparable with the
+    ones already stored for registered students, in one resize and one copy.
+    """
+    target_h, target_w = out.shape[:2]
+    factor = min(target_h / face.shape[0], target_w / face.shape[1])
+    new_w = max(1, int(face.shape[1] * factor))
+    new_h = max(1, int(face.shape[0] * factor))
+    top = (target_h - new_h) // 2
+    left = (target_w - new_w) // 2
+    out[top:top + new_h, left:left + new_w] = cv2.resize(
+        face.astype(np.float32) * (1 / 255), (new_w, new_h))
+
+
+def get_face_embeddings_batch(images: list) -> list:
+    """
+    Embeds several images with a single VGG-Face forward pass.
+    Returns one float32 embedding per image, or None where no face could be prepared.
+    """
+    faces = [_extract_face(image) for image in images]
+    ready = [face for face in faces if face is not None]
+    if not ready:
+        return [None] * len(images)
+    try:
+        batch = np.zeros((len(ready), *vgg_model.input_shape, 3), dtype=np.float32)
+        for face, slot in zip(ready, batch):
+            _letterbox_into(face, slot)
+        embeddings = _vgg_infer(batch).numpy().astype(np.float32)
+    except Exception as e:
+        print(f"Face embedding failed: {e}")
+        return [None] * len(images)
+    embeddings = iter(verification.l2_normalize(embeddings, axis=1))
+    return [next(embeddings) if face is not None else None for face in faces]
+
+
+def get_face_embedding(image: np.ndarray) -> np.ndarray:
+    return get_face_embeddings_batch([image])[0]
+
+
+def _decode_data_url(data_url):
+    """Decodes a base64 image data URL to a BGR array, or None if it is unreadable"""
+    try:
+        # a2b_base64 reads the ASCII str in place; b64decode would first copy it to bytes
+        raw = binascii.a2b_base64(data_url[data_url.index(",") + 1:])
+        return cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), cv2.IMREAD_COLOR)
+    except Exception as e:
+        print(f"Failed to decode image: {e}")
+        return None
+
+
+# Werkzeug's default_stream_factory keeps request bodies up to this size in memory
+# and spools larger ones to a temporary file
+WERKZEUG_SPOOL_MAX_SIZE = 1024 * 500
+
+
+@contextmanager
+def _upload_source(file_storage):
+    """
+    Yields something storage3 can upload from. Files Werkzeug spooled to disk are
+    handed over as a reader on the same descriptor, so httpx streams them in chunks
+    instead of the whole file being read into memory; small in-memory ones as bytes.
+    The reader is closed on exit; the upload's own descriptor stays open.
+    """
+    stream = file_storage.stream
+    # Small bodies are still in memory, and fileno() on a SpooledTemporaryFile
+    # would force them to disk
+    content_length = request.content_length
+    if content_length is not None and content_length <= WERKZEUG_SPOOL_MAX_SIZE:
+        yield file_storage.read()
+        return
+    try:
+        fd = stream.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        yield file_storage.read()
+        return
+    stream.seek(0)
+    with open(fd, 'rb', closefd=False) as reader:
+        yield reader
+
+
+def warmup_face_pipeline():
+    """
+    Runs the real detect -> align -> embed path at startup so the SSD graph
+    and the VGG-Face forward pass are traced before the first request. Uses
+    static/warmup_face.jpg when present, otherwise a synthetic image; that one
+    only exercises the detector, so the model is also run on blank batches.
+    """
+    print("Warming up face recognition model (VGG-Face with SSD)...")
+    try:
+        warm_path = Path(__file__).parent / 'static' / 'warmup_face.jpg'
+        warm_img = cv2.imread(str(warm_path)) if warm_path.exists() else None
+        if warm_img is None:
+            warm_img = np.random.default_rng(0).integers(
+                0, 256, (480, 640, 3), dtype=np.uint8)
+        # Twice per batch shape: registration embeds several images, attendance one
+        for _ in range(2):
+            get_face_embedding(warm_img)
+            get_face_embeddings_batch([warm_img, warm_img])
+            for batch_size in (1, 2):
+                _vgg_infer(np.zeros(
+                    (batch_size, *vgg_model.input_shape, 3), dtype=np.float32))
+        print("Face recognition model warmed up successfully.")
+    except Exception as e:
+        print(f"Error during model warmup: {str(e)}")
+
+
+warmup_face_pipeline()
 
 
 def cleanup_failed_registration(user_id):
@@ -140,17 +677,76 @@ def cleanup_failed_registration(user_id):
         print(f"Cleanup failed for user {user_id}: {e}")
 
 
-def send_email(recipient, subject, body):
+class SMTPSession:
+    """
+    A single authenticated SMTP connection that is reused for a whole batch of
+    emails instead of doing a TLS handshake + login per recipient.
+    The connection is opened lazily on the first send and re-opened if Gmail drops it.
+    """
+
+    # Connections idle for longer than this are health-checked with NOOP before reuse
+    IDLE_CHECK_SECONDS = 30
+
+    def __init__(self):
+        self.smtp = None
+        self.last_used = 0.0
+
+    def connect(self):
+        self.close()
+        context = ssl.create_default_context()
+        self.smtp = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=context)
+        self.smtp.login(EMAIL_SENDER, EMAIL_PASSWORD)
+        self.last_used = time.monotonic()
+
+    def ensure_connected(self):
+        if self.smtp is None:
+            self.connect()
+        elif time.monotonic() - self.last_used > self.IDLE_CHECK_SECONDS:
+            try:
+                self.smtp.noop()
+            except smtplib.SMTPServerDisconnected:
+                self.connect()
+
+    def send(self, em):
+        self.ensure_connected()
+        wait = EMAIL_SEND_INTERVAL - (time.monotonic() - self.last_used)
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            self.smtp.send_message(em)
+        except smtplib.SMTPServerDisconnected:
+            # Lazy re-login: the server closed an idle connection between sends
+            self.connect()
+            self.smtp.send_message(em)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+
+@contextmanager
+def smtp_session():
+    """Yields an SMTPSession that is closed when the batch of emails is done"""
+    session = SMTPSession()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def send_email_via(smtp, recipient, subject, body):
     try:
         em = EmailMessage()
         em['From'] = EMAIL_SENDER
         em['To'] = recipient
         em['Subject'] = subject
         em.set_content(body)
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465, context=context) as smtp:
-            smtp.login(EMAIL_SENDER, EMAIL_PASSWORD)
-            smtp.sendmail(EMAIL_SENDER, recipient, em.as_string())
+        smtp.send(em)
         print(f"Email sent successfully to {recipient}")
         return True
     except Exception as e:
@@ -158,137 +754,232 @@ def send_email(recipient, subject, body):
         return False
 
 
-def check_and_send_at_risk_warning(student_id, module_id):
+def send_email(recipient, subject, body):
+    with smtp_session() as smtp:
+        return send_email_via(smtp, recipient, subject, body)
+
+
+def send_emails_concurrently(messages):
     """
-    Checks if a student has crossed an at-risk threshold (16, 18, or 21 absences)
-    and sends them a warning email if they haven't received one for that level yet.
+    Sends (recipient, subject, body) tuples in parallel, one SMTP connection per
+    worker within Gmail's connection limit, and returns each send's result in order.
     """
+    # Each worker thread keeps its own SMTP connection open for the whole batch
+    worker_local = threading.local()
+    worker_sessions = []
+
+    def send_one(message):
+        session = getattr(worker_local, 'smtp', None)
+        if session is None:
+            session = worker_local.smtp = SMTPSession()
+            worker_sessions.append(session)
+        return send_email_via(session, *message)
+
     try:
-        # Count total absences for this student in this module
-        absences_res = supabase_admin.table('attendance_records').select(
-            'id', count='exact'
-        ).eq('student_id', student_id).eq('module_id', module_id).eq('status', 'absent').execute()
-
-        total_absences = absences_res.count
-
-        # Define the threshold levels
-        thresholds = [16, 18, 21]
-
-        for threshold in thresholds:
-            if total_absences == threshold:
-                # Check if we've already sent a warning for this level
-                existing_warning = supabase_admin.table('at_risk_warnings').select(
-                    'id'
-                ).eq('student_id', student_id).eq('module_id', module_id).eq(
-                    'warning_level', threshold
-                ).execute()
-
-                if existing_warning.data:
-                    # Already sent this warning, skip
-                    continue
+        with ThreadPoolExecutor(max_workers=SMTP_MAX_CONNECTIONS) as executor:
+            return list(executor.map(send_one, messages))
+    finally:
+        for session in worker_sessions:
+            session.close()
 
-                # Fetch student and module details
-                student_res = supabase_admin.table('students').select(
-                    'full_name, email, module_code'
-                ).eq('id', student_id).single().execute()
 
-                if not student_res.data:
-                    print(f"Could not find student {student_id}")
-                    continue
+# Emails sent from request handlers go through this queue, so the request returns
+# immediately and one background worker sends them over a single SMTP connection
+mail_queue = queue.Queue()
 
-                student_name = student_res.data['full_name']
-                student_email = student_res.data['email']
-                module_code = student_res.data['module_code']
-
-                # Fetch lecturer details
-                lecturer_res = supabase_admin.table('modules').select(
-                    'lecturers(full_name)'
-                ).eq('id', module_id).single().execute()
-
-                lecturer_name = "Your Lecturer"
-                if lecturer_res.data and lecturer_res.data.get('lecturers'):
-                    lecturer_name = lecturer_res.data['lecturers']['full_name']
-
-                # Calculate current mark based on absences
-                TOTAL_SEMESTER_CLASSES = 50
-                present_count = TOTAL_SEMESTER_CLASSES - total_absences
-                current_mark = (present_count / TOTAL_SEMESTER_CLASSES) * 100
-
-                # Send appropriate email based on threshold
-                if threshold == 16:
-                    subject = f"Check-in: We miss you in {module_code}"
-                    body = (
-                        f"Hi {student_name},\n\n"
-                        f"I wanted to reach out because I've noticed you've missed {total_absences} classes in {module_code} so far this semester.\n\n"
-                        f"Your current attendance puts you at {current_mark:.0f}% for the module. You've dropped slightly below our 70% target, but you're still above the 60% pass threshold. However, if you miss 5 more classes, your mark will drop below 60% and you'll be at risk of failing.\n\n"
-                        "I believe in your ability to succeed, and I'm here to support you. If there's anything affecting your attendance - whether it's personal challenges, academic struggles, or anything else - please don't hesitate to reach out to me.\n\n"
-                        "You can also contact DUT Student Counselling confidentially at: counselling@dut.ac.za\n\n"
-                        "Let's work together to get you back on track.\n\n"
-                        f"Best regards,\n{lecturer_name}"
-                    )
-                elif threshold == 18:
-                    subject = f"Urgent: Your attendance in {module_code} needs attention"
-                    body = (
-                        f"Hi {student_name},\n\n"
-                        f"This is an important message about your progress in {module_code}.\n\n"
-                        f"You have now missed {total_absences} classes, which means your current mark is {current_mark:.0f}%. You are very close to falling below the 60% pass threshold.\n\n"
-                        "If you miss just 3 more classes, you will fail the module. I'm reaching out because I want to help you avoid this outcome.\n\n"
-                        "Please consider this a serious warning. I strongly encourage you to:\n"
-                        "- Attend all remaining classes\n"
-                        "- Meet with me to discuss any challenges you're facing\n"
-                        "- Reach out to Student Counselling if you need support: counselling@dut.ac.za\n\n"
-                        "It's not too late to turn things around, but you need to act now.\n\n"
-                        f"Sincerely,\n{lecturer_name}"
-                    )
-                elif threshold == 21:
-                    subject = f"CRITICAL: You are at risk of failing {module_code}"
-                    body = (
-                        f"Hi {student_name},\n\n"
-                        f"This is a critical notice regarding your enrollment in {module_code}.\n\n"
-                        f"You have missed {total_absences} classes, which means your current mark is {current_mark:.0f}% - below the 60% pass threshold. You are now at risk of failing this module.\n\n"
-                        "This is an urgent situation that requires immediate action. I need you to:\n\n"
-                        "1. Contact me immediately to discuss your situation\n"
-                        "2. Attend every remaining class without exception\n"
-                        "3. Consider whether you may qualify for special consideration (illness, family emergency, etc.)\n\n"
-                        "If you're facing serious challenges that have affected your attendance, you may be able to submit a special consideration request through the system. Please reach out to me or Student Counselling (counselling@dut.ac.za) for guidance.\n\n"
-                        "I want to help you succeed, but you must take action now.\n\n"
-                        f"Urgent regards,\n{lecturer_name}"
-                    )
-
-                # Send the email
-                email_sent = send_email(student_email, subject, body)
-
-                if email_sent:
-                    # Record that we sent this warning
-                    supabase_admin.table('at_risk_warnings').insert({
-                        'student_id': student_id,
-                        'module_id': module_id,
-                        'warning_level': threshold,
-                        'total_absences_at_warning': total_absences
-                    }).execute()
 
-                    print(
-                        f"Sent {threshold}-absence warning to {student_name}")
+def queue_email(recipient, subject, body, on_sent=None, on_failed=None):
+    """
+    Hands an email to the mail worker; on_sent() runs once it has been sent,
+    on_failed() if sending it failed.
+    """
+    mail_queue.put((recipient, subject, body, on_sent, on_failed))
+
+
+def _mail_worker():
+    session = SMTPSession()
+    while True:
+        recipient, subject, body, on_sent, on_failed = mail_queue.get()
+        try:
+            if send_email_via(session, recipient, subject, body):
+                if on_sent:
+                    on_sent()
+            else:
+                # Start from a fresh connection in case this one is broken
+                session.close()
+                if on_failed:
+                    on_failed()
+        except Exception as e:
+            print(f"--- ERROR in mail worker: {str(e)} ---")
+        finally:
+            mail_queue.task_done()
+
+
+threading.Thread(target=_mail_worker, name='mail-worker', daemon=True).start()
+atexit.register(mail_queue.join)
+
 
+# Lecturer names rarely change, so they are loaded once a day rather than
+# joined into every scheduled query.
+_lecturer_by_module = {}
+_lecturer_cache_lock = threading.Lock()
+
+
+def refresh_lecturer_cache():
+    """Reloads the module id -> lecturer name map from Supabase."""
+    try:
+        res = supabase_admin.table('modules').select(
+            'id, lecturers(full_name)'
+        ).execute()
     except Exception as e:
-        print(f"--- ERROR in check_and_send_at_risk_warning: {str(e)} ---")
+        print(f"--- ERROR refreshing lecturer cache: {e} ---")
+        return
+
+    by_id = {}
+    for module in res.data or []:
+        lecturer = module.get('lecturers')
+        by_id[module['id']] = lecturer['full_name'] if lecturer else "Your Lecturer"
+
+    with _lecturer_cache_lock:
+        _lecturer_by_module.clear()
+        _lecturer_by_module.update(by_id)
+    print(f"Lecturer cache refreshed for {len(by_id)} modules.")
 
 
-def get_current_class_session():
+def get_lecturer_for_module(module_id):
+    with _lecturer_cache_lock:
+        if module_id in _lecturer_by_module:
+            return _lecturer_by_module[module_id]
+
+    # Module added since the last refresh
+    lecturer_res = supabase_admin.table('modules').select(
+        'lecturers(full_name)'
+    ).eq('id', module_id).maybe_single().execute()
+
+    name = "Your Lecturer"
+    if lecturer_res and lecturer_res.data and lecturer_res.data.get('lecturers'):
+        name = lecturer_res.data['lecturers']['full_name']
+    with _lecturer_cache_lock:
+        _lecturer_by_module[module_id] = name
+    return name
+
+
+def _send_at_risk_warning(status):
+    """
+    Queues the at-risk warning for one student_absence_status row if the student
+    is exactly on a threshold (16, 18, or 21 absences) they haven't been warned for.
+    """
+    total_absences = status['total_absences']
+    if total_absences not in AT_RISK_TEMPLATES or total_absences in status['warnings_sent']:
+        # Not on a threshold, or already sent this warning
+        return
+    threshold = total_absences
+
+    student_id = status['student_id']
+    module_id = status['module_id']
+    student_name = status['student_name']
+    module_code = status['module_code']
+    lecturer_name = status['lecturer_name'] or "Your Lecturer"
+
+    # Calculate current mark based on absences
+    TOTAL_SEMESTER_CLASSES = 50
+    present_count = TOTAL_SEMESTER_CLASSES - total_absences
+    current_mark = (present_count / TOTAL_SEMESTER_CLASSES) * 100
+
+    # Send appropriate email based on threshold
+    subject_tpl, body_tpl = AT_RISK_TEMPLATES[threshold]
+    subject = subject_tpl.substitute(module_code=module_code)
+    body = body_tpl.substitute(
+        student_name=student_name, total_absences=total_absences,
+        module_code=module_code, current_mark=f"{current_mark:.0f}",
+        lecturer_name=lecturer_name)
+
+    def record_warning():
+        # Record that we sent this warning
+        supabase_admin.table('at_risk_warnings').insert({
+            'student_id': student_id,
+            'module_id': module_id,
+            'warning_level': threshold,
+            'total_absences_at_warning': total_absences
+        }).execute()
+
+        print(f"Sent {threshold}-absence warning to {student_name}")
+
+    # Queue the email; the warning is only recorded once it has been sent
+    queue_email(status['student_email'], subject, body, on_sent=record_warning)
+
+
+def send_at_risk_warnings_for_module(module_id, student_ids):
+    """
+    Sends at-risk warnings to the students just marked absent in one module.
+    A single RPC returns everyone at or past the first threshold, and only
+    those in student_ids are considered for a warning.
+    """
     try:
-        now = get_system_time()
+        at_risk = supabase_admin.rpc('at_risk_students_for_module', {
+            'p_module_id': module_id
+        }).execute().data or []
+
+        for status in at_risk:
+            if status['student_id'] in student_ids:
+                _send_at_risk_warning(status)
+
+    except Exception as e:
+        print(f"--- ERROR in send_at_risk_warnings_for_module: {str(e)} ---")
+
+
+# Attendance can be marked for this long after a session starts
+ATTENDANCE_WINDOW = timedelta(minutes=30)
+
+
+# The class timetable, kept in memory by load_timetable(): loaded at startup, hourly,
+# and through /api/timetable-changed; both maps are keyed by ISO weekday (1 = Monday).
+# Attendance windows as (start_time, attendance_end_time, session) tuples
+attendance_windows_by_day = {}
+# Class ends as (end_time, session_id, module_id, module_code) tuples, sorted by time
+timetable_by_day = {}
+
+
+def load_timetable():
+    """
+    Loads class_timetable into memory with its times parsed once, and re-plans
+    the next absentee check. Runs at startup, hourly and when the timetable changes.
+    """
+    global attendance_windows_by_day, timetable_by_day
+    windows = defaultdict(list)
+    ends = defaultdict(list)
+    for session in paged(lambda: supabase_admin.table('class_timetable').select(
+            'id, module_id, day_of_week, start_time, end_time, modules(module_code)').order('id')):
+        day = session['day_of_week']
+        start_time = dt_time.fromisoformat(session['start_time'])
+        attendance_end_time = (datetime.combine(
+            datetime.min.date(), start_time) + ATTENDANCE_WINDOW).time()
+        windows[day].append((start_time, attendance_end_time, {
+            'id': session['id'], 'module_id': session['module_id'],
+            'start_time': session['start_time']}))
+
+        end_time = dt_time.fromisoformat(
+            session['end_time']).replace(second=0, microsecond=0)
+        ends[day].append(
+            (end_time, session['id'], session['module_id'], session['modules']['module_code']))
+    for sessions in ends.values():
+        sessions.sort(key=lambda session: session[0])
+    attendance_windows_by_day = dict(windows)
+    timetable_by_day = dict(ends)
+    schedule_next_absentee_check()
+
+
+def _fetch_timetable_for_day(day_of_week):
+    """Returns the day's sessions as (start_time, attendance_end_time, session) tuples"""
+    return attendance_windows_by_day.get(day_of_week, [])
+
+
+def get_current_class_session(now=None):
+    try:
+        now = now or get_system_time()
         day_of_week = now.weekday() + 1
         current_time = now.time()
-        res = supabase_admin.table('class_timetable').select(
-            '*').eq('day_of_week', day_of_week).execute()
-        if not res.data:
-            return None
-
-        for session in res.data:
-            start_time = datetime.strptime(
-                session['start_time'], '%H:%M:%S').time()
-            attendance_end_time = (datetime.combine(
-                get_system_time().date(), start_time) + timedelta(minutes=30)).time()
+        for start_time, attendance_end_time, session in _fetch_timetable_for_day(day_of_week):
             if start_time <= current_time <= attendance_end_time:
                 return session
         return None
@@ -306,124 +997,119 @@ def backfill_missed_attendance():
     try:
         today = get_system_time().date()
 
-        # 1. Get all lectures scheduled before today
-        past_lectures_res = supabase_admin.table('lecture_schedules').select(
-            'lecture_date, module_id, modules(module_code)'
-        ).lt('lecture_date', today.isoformat()).execute()
+        # 1. Find every past lecture with no attendance recorded that day, in one query
+        missing_lectures = list(paged(lambda: supabase_admin.rpc('lectures_missing_attendance', {
+            'p_before': today.isoformat()
+        }).order('lecture_date').order('module_id')))
 
-        if not past_lectures_res.data:
-            print("No past lectures found to check.")
+        if not missing_lectures:
+            print("No past lectures are missing attendance.")
             return
 
-        for lecture in past_lectures_res.data:
+        # 2. Get all students enrolled in any of those modules and bucket them by module
+        module_codes = list({lecture['module_code']
+                            for lecture in missing_lectures})
+        students_by_module = defaultdict(list)
+        for student in paged(lambda: supabase_admin.table('students').select(
+                'id, module_code').in_('module_code', module_codes).order('id')):
+            students_by_module[student['module_code']].append(student['id'])
+
+        # 3. Build 'absent' records for every missing lecture and insert them together
+        absent_records_to_insert = []
+        for lecture in missing_lectures:
             lecture_date_str = lecture['lecture_date']
-            lecture_date = date.fromisoformat(lecture_date_str)
-            module_id = lecture['module_id']
-            module_code = lecture['modules']['module_code']
-
-            # 2. For each past lecture, check if ANY attendance was recorded on that day
-            records_exist_res = supabase_admin.table('attendance_records').select(
-                'id', count='exact'
-            ).eq('module_id', module_id).gte(
-                'created_at', f"{lecture_date_str}T00:00:00"
-            ).lte(
-                'created_at', f"{lecture_date_str}T23:59:59"
-            ).execute()
-
-            # 3. If NO records exist, it means the server was offline. We need to backfill.
-            if records_exist_res.count == 0:
-                print(
-                    f"-> Found missing attendance for {module_code} on {lecture_date_str}. Backfilling records...")
-
-                # 4. Get all students enrolled in this module
-                enrolled_students_res = supabase_admin.table('students').select(
-                    'id').eq('module_code', module_code).execute()
-
-                if not enrolled_students_res.data:
-                    print(
-                        f"   - No students enrolled in {module_code}. Skipping.")
-                    continue
+            module_code = lecture['module_code']
+            print(
+                f"-> Found missing attendance for {module_code} on {lecture_date_str}. Backfilling records...")
 
-                # 5. Create 'absent' records for all enrolled students
-                absent_records_to_insert = []
-                for student in enrolled_students_res.data:
-                    absent_records_to_insert.append({
-                        'student_id': student['id'],
-                        'module_id': module_id,
-                        'status': 'absent',
-                        # Set the creation time to the end of that day for historical accuracy
-                        'created_at': f"{lecture_date_str}T17:00:00"
-                    })
-
-                if absent_records_to_insert:
-                    supabase_admin.table('attendance_records').insert(
-                        absent_records_to_insert).execute()
-                    print(
-                        f"   - Successfully created {len(absent_records_to_insert)} absent records.")
-            else:
+            if not students_by_module[module_code]:
                 print(
-                    f"Attendance for {module_code} on {lecture_date_str} is already recorded.")
+                    f"   - No students enrolled in {module_code}. Skipping.")
+                continue
+
+            for student_id in students_by_module[module_code]:
+                absent_records_to_insert.append({
+                    'student_id': student_id,
+                    'module_id': lecture['module_id'],
+                    'status': 'absent',
+                    # Set the creation time to the end of that day for historical accuracy
+                    'created_at': f"{lecture_date_str}T17:00:00"
+                })
+
+        if absent_records_to_insert:
+            supabase_admin.table('attendance_records').insert(
+                absent_records_to_insert).execute()
+            print(
+                f"   - Successfully created {len(absent_records_to_insert)} absent records.")
 
     except Exception as e:
         print(f"--- ERROR during attendance backfill: {str(e)} ---")
 
 # PAGE RENDERING ROUTES
+# Pages only depend on the Supabase URL and anon key, which are fixed for the life of
+# the process, so each one is rendered once at startup and served as-is.
+STATIC_PAGES = {}
+with app.app_context():
+    for template_name in ('home.html', 'register.html', 'complete_registration.html',
+                          'login.html', 'dashboard.html', 'manage_schedule.html',
+                          'manage_campaigns.html', 'manage_submissions.html',
+                          'success.html', 'attendance.html', 'apology_gateway.html',
+                          'apology_form.html', 'respond.html'):
+        STATIC_PAGES[template_name] = render_template(
+            template_name, supabase_url=url, supabase_key=anon_key)
+
+
+def static_page(template_name):
+    return Response(STATIC_PAGES[template_name], mimetype='text/html')
 
 
 @app.route('/')
-def page_home(): return render_template('home.html')
+def page_home(): return static_page('home.html')
 
 
 @app.route('/register')
-def page_register(): return render_template('register.html')
+def page_register(): return static_page('register.html')
 
 
 @app.route('/complete-registration')
-def page_complete_registration(): return render_template(
+def page_complete_registration(): return static_page(
     'complete_registration.html')
 
 
 @app.route('/login')
-def page_login(): return render_template(
-    'login.html', supabase_url=url, supabase_key=anon_key)
+def page_login(): return static_page('login.html')
 
 
 @app.route('/dashboard')
-def dashboard(): return render_template(
-    'dashboard.html', supabase_url=url, supabase_key=anon_key)
+def dashboard(): return static_page('dashboard.html')
 
 
 @app.route('/manage-schedule')
-def page_manage_schedule(): return render_template(
-    'manage_schedule.html', supabase_url=url, supabase_key=anon_key)
+def page_manage_schedule(): return static_page('manage_schedule.html')
 
 
 @app.route('/manage-campaigns')
-def page_manage_campaigns(): return render_template(
-    'manage_campaigns.html', supabase_url=url, supabase_key=anon_key)
+def page_manage_campaigns(): return static_page('manage_campaigns.html')
 
 
 @app.route('/manage-submissions')
-def page_manage_submissions(): return render_template(
-    'manage_submissions.html', supabase_url=url, supabase_key=anon_key)
+def page_manage_submissions(): return static_page('manage_submissions.html')
 
 
 @app.route('/success')
-def page_success(): return render_template('success.html')
+def page_success(): return static_page('success.html')
 
 
 @app.route('/attendance')
-def page_attendance(): return render_template('attendance.html')
+def page_attendance(): return static_page('attendance.html')
 
 
 @app.route('/apology')
-def page_apology_gateway(): return render_template(
-    'apology_gateway.html', supabase_url=url, supabase_key=anon_key)
+def page_apology_gateway(): return static_page('apology_gateway.html')
 
 
 @app.route('/apology/submit')
-def page_apology_form(): return render_template(
-    'apology_form.html', supabase_url=url, supabase_key=anon_key)
+def page_apology_form(): return static_page('apology_form.html')
 
 
 @app.route('/models/<path:filename>')
@@ -434,57 +1120,67 @@ def serve_model(filename): return send_from_directory(
 @app.route('/campaign/respond')
 def page_campaign_respond():
 
-    return render_template('respond.html')
+    return static_page('respond.html')
 
 # AUTOMATED EMAIL & BACKGROUND TASK FUNCTIONS
 
 
-def send_daily_absence_emails(target_date):
+def send_daily_absence_emails(target_date, module_ids=None):
+    """Emails the day's absentees a catch-up note, for every module or only module_ids."""
     target_date_str = target_date.isoformat()
     print(f"--- Running absence check for date: {target_date_str} ---")
     try:
-        lectures_res = supabase_admin.table('lecture_schedules').select(
-            'id, planned_topic, module_id, modules(module_code, lecturers(full_name))'
-        ).eq('lecture_date', target_date_str).execute()
+        lectures_query = supabase_admin.table('lecture_schedules').select(
+            'id, planned_topic, module_id, modules(module_code)'
+        ).eq('lecture_date', target_date_str)
+        if module_ids is not None:
+            lectures_query = lectures_query.in_('module_id', list(module_ids))
+        lectures_res = lectures_query.execute()
 
         if not lectures_res.data:
             print(f"No lectures were scheduled for {target_date_str}.")
             return
 
-        for lecture in lectures_res.data:
-            module_id = lecture['module_id']
-            lecturer_name = lecture['modules']['lecturers']['full_name']
-            topic = lecture['planned_topic']
-            module_code = lecture['modules']['module_code']
-
-            absent_students_res = supabase_admin.table('attendance_records').select(
-                '*, students(full_name, email)'
-            ).eq('module_id', module_id).eq('status', 'absent').gte(
-                'created_at', f"{target_date_str}T00:00:00"
-            ).lte(
-                'created_at', f"{target_date_str}T23:59:59"
-            ).execute()
-
-            if not absent_students_res.data:
-                print(
-                    f"No students were marked absent for {module_code} on {target_date_str}.")
-                continue
+        # Fetch the day's absences for every lecture at once and group them by module
+        absent_students_res = supabase_admin.table('attendance_records').select(
+            'student_id, module_id, students(full_name, email)'
+        ).in_('module_id', [lecture['module_id'] for lecture in lectures_res.data]).eq(
+            'status', 'absent'
+        ).gte(
+            'created_at', f"{target_date_str}T00:00:00"
+        ).lte(
+            'created_at', f"{target_date_str}T23:59:59"
+        ).execute()
 
-            for record in absent_students_res.data:
-                student_info = record.get('students')
-                if not student_info or not student_info.get('email'):
+        absences_by_module = defaultdict(list)
+        for record in absent_students_res.data:
+            absences_by_module[record['module_id']].append(record)
+
+        with smtp_session() as smtp:
+            for lecture in lectures_res.data:
+                module_id = lecture['module_id']
+                lecturer_name = get_lecturer_for_module(module_id)
+                topic = lecture['planned_topic']
+                module_code = lecture['modules']['module_code']
+
+                if not absences_by_module[module_id]:
                     print(
-                        f"Skipping student with ID {record.get('student_id')} due to missing info.")
+                        f"No students were marked absent for {module_code} on {target_date_str}.")
                     continue
 
-                subject = f"Catch-up for {module_code}"
-                body = (
-                    f"Hi {student_info['full_name']},\n\n"
-                    f"I noticed you weren't in our class today. We covered the topic: '{topic}'.\n\n"
-                    "Please take some time to review the material. If you have any questions, please don't hesitate to reach out.\n\n"
-                    f"Best regards,\n{lecturer_name}"
-                )
-                send_email(student_info['email'], subject, body)
+                for record in absences_by_module[module_id]:
+                    student_info = record.get('students')
+                    if not student_info or not student_info.get('email'):
+                        print(
+                            f"Skipping student with ID {record.get('student_id')} due to missing info.")
+                        continue
+
+                    subject_tpl, body_tpl = DAILY_ABSENCE_TEMPLATE
+                    subject = subject_tpl.substitute(module_code=module_code)
+                    body = body_tpl.substitute(
+                        student_name=student_info['full_name'], topic=topic,
+                        lecturer_name=lecturer_name)
+                    send_email_via(smtp, student_info['email'], subject, body)
 
         print(
             f"--- Absence check for {target_date_str} completed successfully. ---")
@@ -495,66 +1191,100 @@ def send_daily_absence_emails(target_date):
 
 def send_decision_email(submission_id):
     try:
-        res = supabase_admin.table('apology_submissions').select(
-            '*, students!inner(full_name, email, module_code)'
-        ).eq('id', submission_id).single().execute()
+        # Submission, student and lecturer details in one query
+        res = supabase_admin.table('apology_submission_details').select(
+            '*'
+        ).eq('id', submission_id).maybe_single().execute()
 
-        if not res.data or not res.data.get('students'):
+        if not res or not res.data:
             print(
                 f"EMAIL_ERROR: No submission or linked student found for ID {submission_id}")
             return False
 
         submission = res.data
-        student_info = submission['students']
-        student_module_code = student_info.get('module_code')
-
-        if not student_module_code:
+        if not submission['module_code']:
             print(
-                f"EMAIL_ERROR: Student {student_info.get('full_name')} has no module_code assigned.")
+                f"EMAIL_ERROR: Student {submission['student_name']} has no module_code assigned.")
             return False
 
-        module_res = supabase_admin.table('modules').select(
-            'lecturers!inner(full_name)'
-        ).eq('module_code', student_module_code).single().execute()
-
-        lecturer_name = "Your Lecturer"
-        if module_res.data and module_res.data.get('lecturers'):
-            lecturer_name = module_res.data['lecturers']['full_name']
-
-        student_email = student_info['email']
-        student_name = student_info['full_name']
+        lecturer_name = submission['lecturer_name'] or "Your Lecturer"
+        student_email = submission['student_email']
+        student_name = submission['student_name']
         assessment = submission['assessment_name']
         status = submission['status']
         reason = submission['decision_reason']
-        subject = f"Update on your submission for {assessment}"
-
-        if status == 'Approved':
-            body = (
-                f"Hi {student_name},\n\n"
-                f"Good news! Your special consideration request for '{assessment}' has been approved.\n\n"
-                f"Reason: {reason}\n\n"
-                f"I will be in touch with you shortly regarding the arrangements for your supplementary assessment.\n\n"
-                f"Best regards,\n{lecturer_name}"
-            )
-        else:  # Rejected
-            body = (
-                f"Hi {student_name},\n\n"
-                f"This email is to inform you that your special consideration request for '{assessment}' has been rejected.\n\n"
-                f"Reason: {reason}\n\n"
-                f"If you would like to discuss this further, please do not hesitate to contact me.\n\n"
-                f"Sincerely,\n{lecturer_name}"
-            )
-
-        return send_email(student_email, subject, body)
+        subject = DECISION_SUBJECT_TEMPLATE.substitute(assessment=assessment)
+        body_tpl = DECISION_BODY_TEMPLATES['Approved' if status ==
+                                           'Approved' else 'Rejected']
+        body = body_tpl.substitute(
+            student_name=student_name, assessment=assessment, reason=reason,
+            lecturer_name=lecturer_name)
+
+        queue_email(student_email, subject, body)
+        return True
     except Exception as e:
         print(f"--- ERROR in send_decision_email: {str(e)} ---")
         return False
 
 
-def send_weekly_summary_emails():
-    from concurrent.futures import ThreadPoolExecutor
-    from collections import defaultdict
+def _summarize_module(module, start_of_last_week, end_of_last_week):
+    """
+    Builds last week's perfect- and zero-attendance emails for one module.
+    Only queries Supabase; sending is left to send_weekly_summary_emails.
+    """
+    module_id = module['id']
+    module_code = module['module_code']
+    lecturer_name = get_lecturer_for_module(module_id)
+    perfect_attendance = []
+    zero_attendance = []
+
+    # Get total lectures scheduled
+    lectures_this_week_res = supabase_admin.table('lecture_schedules').select(
+        'id', count='exact'
+    ).eq('module_id', module_id).gte(
+        'lecture_date', start_of_last_week.isoformat()
+    ).lte(
+        'lecture_date', end_of_last_week.isoformat()
+    ).execute()
+    total_lectures_this_week = lectures_this_week_res.count
+
+    if total_lectures_this_week == 0:
+        return perfect_attendance, zero_attendance
+
+    # Present counts per student for the week, aggregated in Postgres
+    summary_rows = paged(lambda: supabase_admin.rpc('weekly_attendance_summary', {
+        'p_module_id': module_id,
+        'p_start': f"{start_of_last_week.isoformat()}T00:00:00",
+        'p_end': f"{end_of_last_week.isoformat()}T23:59:59"
+    }).order('student_id'))
+
+    # Separate into two groups
+    for details in summary_rows:
+        if not details.get('email'):
+            continue
+
+        present_count = details['present_count']
+
+        if present_count == total_lectures_this_week:
+            template, recipients = PERFECT_ATTENDANCE_TEMPLATE, perfect_attendance
+        elif present_count == 0:
+            template, recipients = ZERO_ATTENDANCE_TEMPLATE, zero_attendance
+        else:
+            continue
+
+        subject_tpl, body_tpl = template
+        recipients.append({
+            'email': details['email'],
+            'subject': subject_tpl.substitute(module_code=module_code),
+            'body': body_tpl.substitute(
+                student_name=details['full_name'], module_code=module_code,
+                lecturer_name=lecturer_name)
+        })
 
+    return perfect_attendance, zero_attendance
+
+
+def send_weekly_summary_emails():
     today = get_system_time().date()
     start_of_last_week = today - timedelta(days=today.weekday() + 7)
     end_of_last_week = today - timedelta(days=today.weekday() + 1)
@@ -563,104 +1293,29 @@ def send_weekly_summary_emails():
 
     try:
         modules_res = supabase_admin.table('modules').select(
-            'id, module_code, lecturers(full_name)'
+            'id, module_code'
         ).execute()
         if not modules_res.data:
             return
 
-        for module in modules_res.data:
-            module_id = module['id']
-            module_code = module['module_code']
-            lecturer_name = module['lecturers']['full_name']
-
-            # Get total lectures scheduled
-            lectures_this_week_res = supabase_admin.table('lecture_schedules').select(
-                'id', count='exact'
-            ).eq('module_id', module_id).gte(
-                'lecture_date', start_of_last_week.isoformat()
-            ).lte(
-                'lecture_date', end_of_last_week.isoformat()
-            ).execute()
-            total_lectures_this_week = lectures_this_week_res.count
-
-            if total_lectures_this_week == 0:
-                continue
-
-            # BULK QUERY: Get ALL attendance records for the week
-            weekly_records_res = supabase_admin.table('attendance_records').select(
-                'status, student_id, students(full_name, email)'
-            ).eq('module_id', module_id).gte(
-                'created_at', start_of_last_week.isoformat()
-            ).lte(
-                'created_at', f"{end_of_last_week.isoformat()}T23:59:59"
-            ).execute()
-
-            if not weekly_records_res.data:
-                continue
+        # Modules are independent, so their Supabase queries can overlap
+        summaries = list(APP_EXECUTOR.map(
+            lambda module: _summarize_module(
+                module, start_of_last_week, end_of_last_week),
+            modules_res.data))
 
-            # Process in memory: count attendance per student
-            student_data = defaultdict(
-                lambda: {'present_count': 0, 'details': None})
+        perfect_attendance = [
+            email for perfect, _ in summaries for email in perfect]
+        zero_attendance = [email for _, zero in summaries for email in zero]
 
-            for record in weekly_records_res.data:
-                student_id = record['student_id']
-                student_data[student_id]['details'] = record['students']
-                if record['status'] == 'present':
-                    student_data[student_id]['present_count'] += 1
-
-            # Separate into two groups
-            perfect_attendance = []
-            zero_attendance = []
-
-            for student_id, data in student_data.items():
-                details = data['details']
-                if not details or not details.get('email'):
-                    continue
-
-                present_count = data['present_count']
-
-                if present_count == total_lectures_this_week:
-                    perfect_attendance.append({
-                        'email': details['email'],
-                        'subject': f"Great work in {module_code} last week!",
-                        'body': (
-                            f"Hi {details['full_name']},\n\n"
-                            f"Well done! My records show you attended all our {module_code} classes last week. "
-                            f"Your commitment is fantastic to see.\n\n"
-                            "Keep up the great work!\n\n"
-                            f"Best regards,\n{lecturer_name}"
-                        )
-                    })
-                elif present_count == 0:
-                    zero_attendance.append({
-                        'email': details['email'],
-                        'subject': f"Checking in regarding {module_code}",
-                        'body': (
-                            f"Hi {details['full_name']},\n\n"
-                            f"I noticed you were not in any of our {module_code} classes last week "
-                            f"and wanted to check in.\n\n"
-                            "We miss you in class. If you are facing any challenges, please know you don't have to go through them alone. "
-                            "You can reply to this email to talk to me, or confidentially reach out to DUT Student Counselling for support at: counselling@dut.ac.za\n\n"
-                            "I am here to help you succeed, so please let me know if there's anything I can do.\n\n"
-                            f"Sincerely,\n{lecturer_name}"
-                        )
-                    })
-
-            # Helper function to send a single email
-            def send_single_email(email_data):
-                return send_email(email_data['email'], email_data['subject'], email_data['body'])
-
-            # Send emails in parallel with ThreadPoolExecutor
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                if perfect_attendance:
-                    print(
-                        f"Sending {len(perfect_attendance)} perfect attendance emails in parallel...")
-                    list(executor.map(send_single_email, perfect_attendance))
-
-                if zero_attendance:
-                    print(
-                        f"Sending {len(zero_attendance)} zero attendance emails in parallel...")
-                    list(executor.map(send_single_email, zero_attendance))
+        if perfect_attendance:
+            print(
+                f"Sending {len(perfect_attendance)} perfect attendance emails in parallel...")
+        if zero_attendance:
+            print(
+                f"Sending {len(zero_attendance)} zero attendance emails in parallel...")
+        send_emails_concurrently([(e['email'], e['subject'], e['body'])
+                                  for e in perfect_attendance + zero_attendance])
 
         print("--- Weekly summary check completed successfully. ---")
     except Exception as e:
@@ -669,7 +1324,8 @@ def send_weekly_summary_emails():
 
 def send_campaign_emails(campaign_id):
     """
-    Fetches a campaign and its target students, then sends the emails immediately.
+    Fetches a campaign and its target students, then queues their emails for the
+    mail worker. Runs off the request thread, on APP_EXECUTOR.
     """
     try:
         print(
@@ -677,7 +1333,7 @@ def send_campaign_emails(campaign_id):
 
         # 1. Fetch the campaign details
         campaign_res = supabase_admin.table('campaigns').select(
-            '*').eq('id', campaign_id).single().execute()
+            'id, title, campaign_type, incentive').eq('id', campaign_id).single().execute()
         if not campaign_res.data:
             print(
                 f"EMAIL_ERROR: Could not find campaign with ID {campaign_id}.")
@@ -692,135 +1348,91 @@ def send_campaign_emails(campaign_id):
                 f"EMAIL_ERROR: No students found for campaign '{campaign['title']}'.")
             return
 
-        # 3. Loop through students and send emails
-        for student in students_res.data:
-            token_data = {
-                'campaign_id': campaign['id'], 'student_id': student['id']}
-            token = campaign_serializer.dumps(token_data)
-            base_url = "http://127.0.0.1:5000"
-            response_link = f"{base_url}/campaign/respond?token={token}"
-
-            if campaign['campaign_type'] == 'WEEKLY_QUIZ':
-                subject = f"Weekly Progress Quiz is Ready! ({campaign['title']})"
-                body = (
-                    f"Hi {student['full_name']},\n\n"
-                    f"The weekly progress quiz is now available. Please use the unique link below to respond:\n\n"
-                    f"Link: {response_link}\n\n"
-                    f"Complete the quiz for a chance to win an '{campaign['incentive']}'.\n\n"
-                    "Good luck!\nYour Lecturer"
-                )
-            elif campaign['campaign_type'] == 'FEEDBACK_SURVEY':
-                subject = "Your Feedback is Important - Anonymous Survey"
-                body = (
-                    f"Hi {student['full_name']},\n\n"
-                    f"Please take a moment to provide anonymous feedback on the module using the secure link below:\n\n"
-                    f"Link: {response_link}\n\n"
-                    f"You'll be entered into a draw to win a '{campaign['incentive']}'.\n\n"
-                    "Thank you,\nYour Lecturer"
-                )
-            else:
-                continue
-
-            send_email(student['email'], subject, body)
+        if campaign['campaign_type'] not in CAMPAIGN_TEMPLATES:
+            print(
+                f"EMAIL_ERROR: Unknown campaign type '{campaign['campaign_type']}'.")
+            return
 
-        # 4. Update the campaign status to 'Sent'
-        supabase_admin.table('campaigns').update(
-            {'status': 'Sent'}).eq('id', campaign['id']).execute()
-        print(f"--- Campaign '{campaign['title']}' sent successfully. ---")
+        # 3. Sign every student's response token, then queue their emails
+        subject_tpl, body_tpl = CAMPAIGN_TEMPLATES[campaign['campaign_type']]
+        subject = subject_tpl.substitute(title=campaign['title'])
+        # Fill in the campaign-wide parts once; '$' is escaped so the incentive
+        # text cannot be read as a placeholder when the result is re-parsed
+        body_tpl = Template(body_tpl.safe_substitute(
+            incentive=str(campaign['incentive']).replace('$', '$$')))
+        link_prefix = "http://127.0.0.1:5000/campaign/respond?token="
+        dumps = campaign_serializer.dumps
+        tokens = [dumps({'campaign_id': campaign['id'], 'student_id': student['id']})
+                  for student in students_res.data]
+
+        # 4. Once every email has been attempted, mark the campaign 'Sent' if
+        # any were delivered. The callbacks all run on the single mail worker.
+        outcome = {'delivered': 0, 'pending': len(students_res.data)}
+
+        def record_outcome(delivered):
+            outcome['delivered'] += delivered
+            outcome['pending'] -= 1
+            if outcome['pending']:
+                return
+            status = 'Sent' if outcome['delivered'] else 'Failed'
+            supabase_admin.table('campaigns').update(
+                {'status': status}).eq('id', campaign['id']).execute()
+            print(
+                f"--- Campaign '{campaign['title']}' {status.lower()}: {outcome['delivered']} of {len(students_res.data)} emails delivered. ---")
+
+        for student, token in zip(students_res.data, tokens):
+            body = body_tpl.substitute(
+                student_name=student['full_name'], response_link=link_prefix + token)
+            queue_email(student['email'], subject, body,
+                        on_sent=lambda: record_outcome(1),
+                        on_failed=lambda: record_outcome(0))
+        print(
+            f"--- Campaign '{campaign['title']}' queued {len(students_res.data)} emails. ---")
 
     except Exception as e:
         print(f"--- ERROR in send_campaign_emails: {str(e)} ---")
+        try:
+            supabase_admin.table('campaigns').update(
+                {'status': 'Failed'}).eq('id', campaign_id).execute()
+        except Exception as update_error:
+            print(
+                f"--- ERROR marking campaign {campaign_id} as failed: {str(update_error)} ---")
 
 
-def check_and_process_finished_classes():
-    """
-    This function runs every few minutes. It uses the Time Machine-aware 
-    get_system_time() to check if any classes have recently ended and marks 
-    absentees if they haven't been marked already for that session.
-    """
-    with app.app_context():
-        now = get_system_time()
-        today_str = now.date().isoformat()
-        current_day_of_week = now.weekday() + 1
+# Lecturer pages call several endpoints in a burst, each with the same token.
+# Entries are keyed by a hash of the token, so raw tokens are never kept around.
+USER_CACHE_SECONDS = 60
+USER_CACHE_MAXSIZE = 2048
+_user_cache = OrderedDict()  # token digest -> (expires_at, user_res)
+_user_cache_lock = threading.Lock()
 
-        print(
-            f"SCHEDULER (Interval): Running check at simulated time {now.strftime('%Y-%m-%d %H:%M:%S')}")
 
-        try:
-            sessions_res = supabase_admin.table('class_timetable').select(
-                '*, modules(module_code)'
-            ).eq('day_of_week', current_day_of_week).execute()
+def get_user_cached(token):
+    """supabase_anon.auth.get_user(token), reused for up to a minute. Failed lookups raise and are not cached."""
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(key)
+        if cached and cached[0] > now:
+            _user_cache.move_to_end(key)
+            return cached[1]
 
-            if not sessions_res.data:
-                return
+    user_res = supabase_anon.auth.get_user(token)
+    with _user_cache_lock:
+        _user_cache[key] = (now + USER_CACHE_SECONDS, user_res)
+        _user_cache.move_to_end(key)
+        while len(_user_cache) > USER_CACHE_MAXSIZE:
+            _user_cache.popitem(last=False)
+    return user_res
 
-            for session in sessions_res.data:
-                end_time = datetime.strptime(
-                    session['end_time'], '%H:%M:%S').time()
-                class_end_datetime = now.replace(
-                    hour=end_time.hour, minute=end_time.minute, second=0, microsecond=0)
-
-                # Check if class has ended but absentees were not yet processed for today's session
-                if now > class_end_datetime:
-                    module_id = session['module_id']
-                    module_code = session['modules']['module_code']
-
-                    # Check if 'absent' records for this module were already created today after the class ended
-                    check_res = supabase_admin.table('attendance_records').select('id', count='exact') \
-                        .eq('module_id', module_id) \
-                        .eq('status', 'absent') \
-                        .gte('created_at', class_end_datetime.isoformat()) \
-                        .execute()
-
-                    # If absent records already exist for this session, skip.
-                    if check_res.count > 0:
-                        continue
 
-                    print(
-                        f"SCHEDULER: DETECTED ENDED CLASS! Processing absentees for {module_code}...")
+def _clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
 
-                    enrolled_res = supabase_admin.table('students').select(
-                        'id').eq('module_code', module_code).execute()
-                    if not enrolled_res.data:
-                        continue
-                    enrolled_ids = {s['id'] for s in enrolled_res.data}
-
-                    recorded_res = supabase_admin.table('attendance_records').select('student_id') \
-                        .eq('module_id', module_id) \
-                        .gte('created_at', f"{today_str}T00:00:00") \
-                        .lte('created_at', f"{today_str}T23:59:59") \
-                        .execute()
-                    recorded_ids = {r['student_id'] for r in recorded_res.data}
-
-                    absent_ids = enrolled_ids - recorded_ids
-
-                    if absent_ids:
-                        absent_records = []
-                        for student_id in absent_ids:
-                            absent_records.append({
-                                'student_id': student_id,
-                                'module_id': module_id,
-                                'status': 'absent',
-                                'created_at': class_end_datetime.isoformat()
-                            })
-
-                        supabase_admin.table('attendance_records').insert(
-                            absent_records).execute()
-                        print(
-                            f"Marked {len(absent_ids)} students as absent for {module_code}.")
 
-                        # NEW: Check each absent student for at-risk warnings
-                        for student_id in absent_ids:
-                            check_and_send_at_risk_warning(
-                                student_id, module_id)
+get_user_cached.cache_clear = _clear_user_cache
 
-                        # Trigger the email function for the processed date
-                        send_daily_absence_emails(target_date=now.date())
-                    else:
-                        print(f"All students accounted for in {module_code}.")
-        except Exception as e:
-            print(
-                f"--- ERROR in check_and_process_finished_classes: {str(e)} ---")
 
 # API ROUTES
 
@@ -848,19 +1460,7 @@ def api_student_register():
         user_id = res.user.id
 
         # Wait for user creation to be fully committed
-        max_retries = 5
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                # Try to fetch the user to confirm creation
-                user_check = supabase_admin.auth.admin.get_user_by_id(user_id)
-                if user_check:
-                    break
-            except:
-                retry_count += 1
-                time.sleep(1)
-                if retry_count == max_retries:
-                    raise Exception("User creation confirmation failed")
+        with_retries(lambda: supabase_admin.auth.admin.get_user_by_id(user_id))
 
         profile_data = {
             "full_name": data.get('full_name'),
@@ -871,19 +1471,13 @@ def api_student_register():
         }
 
         # Retry logic for profile update
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                update_result = supabase_admin.table('students').update(
-                    profile_data).eq('id', user_id).execute()
-                if update_result.data:
-                    break
-            except Exception as update_error:
-                retry_count += 1
-                if retry_count == max_retries:
-                    cleanup_failed_registration(user_id)
-                    return jsonify({"error": "Profile update failed. Please try registering again."}), 500
-                time.sleep(1)
+        try:
+            with_retries(lambda: supabase_admin.table('students').update(
+                profile_data).eq('id', user_id).execute().data)
+        except Exception as update_error:
+            print(f"Profile update failed: {update_error}")
+            cleanup_failed_registration(user_id)
+            return jsonify({"error": "Profile update failed. Please try registering again."}), 500
 
         return jsonify({"message": "Verification email sent! Please check your inbox and click the link to continue."}), 200
 
@@ -907,14 +1501,14 @@ def api_student_complete_registration():
     token = auth_header.split(' ')[1]
 
     try:
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid user token."}), 401
 
         # Verify user exists in students table first
         existing_user = supabase_admin.table('students').select(
-            'id, full_name').eq('id', user_res.user.id).execute()
-        if not existing_user.data:
+            'id', count='exact', head=True).eq('id', user_res.user.id).execute()
+        if not existing_user.count:
             return jsonify({"error": "User profile not found. Please try registering again."}), 404
 
         data = request.get_json()
@@ -927,27 +1521,24 @@ def api_student_complete_registration():
         # Process images with better error reporting
         all_embeddings = []
         failed_images = []
+        decoded_images = []
 
-        for i, img_url in enumerate(images_data):
-            try:
-                img_bytes = base64.b64decode(img_url.split(",")[1])
-                img_np = np.frombuffer(img_bytes, dtype=np.uint8)
-                img = cv2.imdecode(img_np, cv2.IMREAD_COLOR)
-
-                if img is None:
-                    print(f"Failed to decode image {i + 1}")
-                    failed_images.append(i + 1)
-                    continue
-
-                emb = get_face_embedding(img)
-                if emb:
-                    all_embeddings.append(emb)
-                else:
-                    failed_images.append(i + 1)
-
-            except Exception as e:
-                print(f"Failed to process image {i + 1}: {e}")
+        # Decode the captures in parallel; cv2.imdecode releases the GIL
+        for i, img in enumerate(APP_EXECUTOR.map(_decode_data_url, images_data)):
+            if img is None:
                 failed_images.append(i + 1)
+            else:
+                decoded_images.append((i + 1, img))
+
+        # Embed all decoded captures in one batched forward pass
+        embeddings = get_face_embeddings_batch(
+            [img for _, img in decoded_images])
+        for (image_number, _), emb in zip(decoded_images, embeddings):
+            if emb is not None:
+                all_embeddings.append(emb)
+            else:
+                failed_images.append(image_number)
+        failed_images.sort()
 
         if len(all_embeddings) == 0:
             return jsonify({"error": f"Could not process any images. Failed images: {failed_images}. Please try again with clearer face images."}), 400
@@ -956,7 +1547,7 @@ def api_student_complete_registration():
                 f"Warning: Only processed {len(all_embeddings)} out of {len(images_data)} images. Failed: {failed_images}")
 
         # Create master embedding from successful captures
-        master_embedding = np.mean(all_embeddings, axis=0).tolist()
+        master_embedding = np.stack(all_embeddings).mean(axis=0).tolist()
 
         # Update both the embedding and the final module code with retry logic
         update_data = {
@@ -964,21 +1555,12 @@ def api_student_complete_registration():
             'module_code': module_code
         }
 
-        max_retries = 3
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                update_result = supabase_admin.table('students').update(
-                    update_data).eq('id', user_res.user.id).execute()
-                if update_result.data:
-                    break
-            except Exception as update_error:
-                retry_count += 1
-                if retry_count == max_retries:
-                    print(
-                        f"Final update failed after {max_retries} retries: {update_error}")
-                    return jsonify({"error": "Registration completion failed. Please try again."}), 500
-                time.sleep(1)
+        try:
+            with_retries(lambda: supabase_admin.table('students').update(
+                update_data).eq('id', user_res.user.id).execute().data, attempts=3)
+        except Exception as update_error:
+            print(f"Final update failed after 3 attempts: {update_error}")
+            return jsonify({"error": "Registration completion failed. Please try again."}), 500
 
         return jsonify({"message": "Face scan successful! Registration complete."}), 200
     except Exception as e:
@@ -990,18 +1572,39 @@ def api_student_complete_registration():
 
 @app.route('/api/get-current-class', methods=['GET'])
 def api_get_current_class():
-    session = get_current_class_session()
+    # Polled by every open attendance page; the timetable lookup behind this is
+    # served from memory, so polling does not reach the database
     current_system_time = get_system_time()
+    session = get_current_class_session(current_system_time)
     if session:
-        start_time = datetime.strptime(
-            session['start_time'], '%H:%M:%S').time()
-        attendance_ends_dt = (datetime.combine(
-            current_system_time.date(), start_time) + timedelta(minutes=30))
+        attendance_ends_dt = datetime.combine(
+            current_system_time.date(), dt_time.fromisoformat(session['start_time'])) + ATTENDANCE_WINDOW
         return jsonify({"isActive": True, "attendance_ends": attendance_ends_dt.isoformat(), "current_time": current_system_time.isoformat()}), 200
     else:
         return jsonify({"isActive": False, "current_time": current_system_time.isoformat()}), 200
 
 
+# (student_id, module_id, date) -> expiry, so a student scanning again shortly
+# after being marked is turned away without another database lookup
+MARKED_MEMO_SECONDS = 600
+_marked_attendance = {}
+_marked_attendance_lock = threading.Lock()
+
+
+def _recently_marked(key):
+    with _marked_attendance_lock:
+        return _marked_attendance.get(key, 0) > time.monotonic()
+
+
+def _remember_marked(key):
+    now = time.monotonic()
+    with _marked_attendance_lock:
+        if len(_marked_attendance) > 10000:
+            for stale in [k for k, expiry in _marked_attendance.items() if expiry <= now]:
+                del _marked_attendance[stale]
+        _marked_attendance[key] = now + MARKED_MEMO_SECONDS
+
+
 @app.route('/api/mark-attendance', methods=['POST'])
 def api_mark_attendance():
     active_class = get_current_class_session()
@@ -1012,16 +1615,16 @@ def api_mark_attendance():
     if not data or 'image_data' not in data:
         return jsonify({"error": "No image data provided."}), 400
     try:
-        header, encoded = data['image_data'].split(",", 1)
-        live_image = cv2.imdecode(np.frombuffer(
-            base64.b64decode(encoded), dtype=np.uint8), cv2.IMREAD_COLOR)
+        live_image = _decode_data_url(data['image_data'])
+        if live_image is None:
+            return jsonify({"error": "Could not read the image."}), 400
 
         embedding = get_face_embedding(live_image)
-        if not embedding:
+        if embedding is None:
             return jsonify({"error": "No face could be detected in the image."}), 400
 
-        match_res = supabase_admin.rpc('match_student', {'live_embedding': [
-                                       float(x) for x in embedding], 'match_threshold': 0.62}).execute()
+        match_res = supabase_admin.rpc('match_student', {
+            'live_embedding': embedding.tolist(), 'match_threshold': 0.62}).execute()
         if not match_res.data:
             return jsonify({"error": "Face not recognized."}), 404
 
@@ -1031,9 +1634,14 @@ def api_mark_attendance():
 
         today_start = get_system_time().replace(
             hour=0, minute=0, second=0, microsecond=0)
-        existing_record = supabase_admin.table('attendance_records').select('id', count='exact').eq('student_id', student_id).eq(
-            'module_id', active_class['module_id']).gte('created_at', today_start.isoformat()).execute()
-        if existing_record.count > 0:
+        marked_key = (student_id, active_class['module_id'], today_start.date())
+        already_marked = _recently_marked(marked_key)
+        if not already_marked:
+            existing_record = supabase_admin.table('attendance_records').select('id', count='exact').eq('student_id', student_id).eq(
+                'module_id', active_class['module_id']).gte('created_at', today_start.isoformat()).execute()
+            already_marked = existing_record.count > 0
+        if already_marked:
+            _remember_marked(marked_key)
             return jsonify({"error": f"{full_name} has already been marked present for this class."}), 409
 
         attendance_record = {'student_id': student_id,
@@ -1043,6 +1651,7 @@ def api_mark_attendance():
 
         supabase_admin.table('attendance_records').insert(
             attendance_record).execute()
+        _remember_marked(marked_key)
         return jsonify({"message": f"Attendance marked for {full_name}!", "full_name": full_name}), 200
     except Exception as e:
         print(f"--- ERROR in mark-attendance: {str(e)} ---")
@@ -1076,7 +1685,7 @@ def api_handle_apology_submission():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Authentication required."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid or expired token."}), 401
 
@@ -1092,11 +1701,12 @@ def api_handle_apology_submission():
 
         file_extension = Path(proof_file.filename).suffix
         file_path_in_bucket = f"{student_id}/{int(time.time())}{file_extension}"
-        supabase_admin.storage.from_('proof-uploads').upload(
-            file=proof_file.read(),
-            path=file_path_in_bucket,
-            file_options={"content-type": proof_file.content_type}
-        )
+        with _upload_source(proof_file) as upload_source:
+            supabase_admin.storage.from_('proof-uploads').upload(
+                file=upload_source,
+                path=file_path_in_bucket,
+                file_options={"content-type": proof_file.content_type}
+            )
         submission_data = {
             'student_id': student_id, 'assessment_name': assessment_name, 'reason_category': reason_category,
             'reason_other_details': reason_other_details, 'proof_file_path': file_path_in_bucket, 'status': 'Pending'
@@ -1104,6 +1714,8 @@ def api_handle_apology_submission():
         supabase_admin.table('apology_submissions').insert(
             submission_data).execute()
         return jsonify({"message": "Your submission has been received successfully."}), 201
+    except RequestEntityTooLarge:
+        return jsonify({"error": "Proof file is too large."}), 413
     except Exception as e:
         print(f"--- ERROR in submit-apology: {str(e)} ---")
         return jsonify({"error": "An unexpected server error occurred."}), 500
@@ -1118,17 +1730,26 @@ def api_get_apologies():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Authentication required."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
         submissions_res = supabase_admin.table('apology_submissions').select(
-            '*, students(full_name)').order('created_at', desc=True).execute()
-        for sub in submissions_res.data:
-            if sub['proof_file_path']:
-                signed_url_res = supabase_admin.storage.from_(
-                    'proof-uploads').create_signed_url(sub['proof_file_path'], 3600)
-                sub['proof_file_url'] = signed_url_res['signedURL']
+            'id, assessment_name, reason_category, reason_other_details, proof_file_path, '
+            'status, decision_reason, created_at, students(full_name)'
+        ).order('created_at', desc=True).execute()
+        # Sign every proof file in one Storage request
+        proof_paths = [sub['proof_file_path']
+                       for sub in submissions_res.data if sub['proof_file_path']]
+        if proof_paths:
+            signed_urls = supabase_admin.storage.from_(
+                'proof-uploads').create_signed_urls(proof_paths, 3600)
+            url_by_path = {item['path']: item['signedURL']
+                           for item in signed_urls if not item['error']}
+            for sub in submissions_res.data:
+                if sub['proof_file_path']:
+                    sub['proof_file_url'] = url_by_path.get(
+                        sub['proof_file_path'])
         return jsonify(submissions_res.data), 200
     except Exception as e:
         print(f"--- ERROR in get-apologies: {str(e)} ---")
@@ -1142,7 +1763,7 @@ def api_update_apology_status():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Authentication required."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
@@ -1168,7 +1789,7 @@ def handle_guide_upload():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Missing token."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
@@ -1186,14 +1807,14 @@ def handle_guide_upload():
             return jsonify({"error": "No file selected."}), 400
         if file and (file.filename.endswith('.txt') or file.filename.endswith('.md')):
             content = file.stream.read().decode("utf-8")
-            schedule_pattern = re.compile(r".*\((\d{4}-\d{2}-\d{2})\):\s*(.*)")
             schedule_entries = [{"module_id": module_id, "lecturer_id": user_res.user.id, "lecture_date": match.group(
-                1), "planned_topic": match.group(2).strip()} for line in content.splitlines() if (match := schedule_pattern.match(line))]
+                1), "planned_topic": match.group(2).strip()} for match in SCHEDULE_PATTERN.finditer(content)]
             if not schedule_entries:
                 return jsonify({"error": "Could not find any valid schedule entries in the file."}), 400
 
             supabase_admin.table('lecture_schedules').upsert(
                 schedule_entries, on_conflict='module_id, lecture_date').execute()
+            _lecture_counts.cache_clear()
             return jsonify({"message": f"Successfully processed {len(schedule_entries)} lecture topics!"}), 200
 
         return jsonify({"error": "Invalid file type."}), 400
@@ -1202,6 +1823,20 @@ def handle_guide_upload():
         return jsonify({"error": "An unexpected server error occurred."}), 500
 
 
+@ttl_cache(60)
+def _lecture_counts(module_id, today):
+    """
+    Returns (total lectures scheduled, lectures held up to and including today)
+    for a module. Cached per module and day; a guide upload clears it.
+    """
+    total_res = supabase_admin.table('lecture_schedules').select(
+        'id', count='exact', head=True).eq('module_id', module_id).execute()
+    held_res = supabase_admin.table('lecture_schedules').select(
+        'id', count='exact', head=True
+    ).eq('module_id', module_id).lte('lecture_date', today.isoformat()).execute()
+    return total_res.count or 0, held_res.count or 0
+
+
 @app.route('/api/dashboard-data', methods=['GET'])
 def api_get_dashboard_data():
     try:
@@ -1209,7 +1844,7 @@ def api_get_dashboard_data():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Authentication required."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
@@ -1222,70 +1857,56 @@ def api_get_dashboard_data():
 
         # --- DYNAMIC CALCULATION (NO MORE HARDCODING) ---
 
-        # 1. Get the TOTAL number of scheduled lectures for the entire semester for this module
-        total_schedule_res = supabase_admin.table('lecture_schedules').select(
-            'id', count='exact'
-        ).eq('module_id', module_id).execute()
-        total_semester_classes = total_schedule_res.count
+        # 1. The TOTAL number of scheduled lectures for the semester, and
+        # 2. the number held up to and including today
+        today = get_system_time().date()
+        total_semester_classes, classes_held_so_far = _lecture_counts(
+            module_id, today)
 
         if total_semester_classes == 0:
             return jsonify({"error": "No lectures have been scheduled for this module yet."}), 404
 
-        # 2. Get the number of lectures held up to and including today
-        today = get_system_time().date()
-        held_schedule_res = supabase_admin.table('lecture_schedules').select(
-            'id', count='exact'
-        ).eq('module_id', module_id).lte('lecture_date', today.isoformat()).execute()
-        classes_held_so_far = held_schedule_res.count
-
-        mark_per_class = 100 / total_semester_classes
-        pass_threshold = 60
         # --- END DYNAMIC CALCULATION ---
 
-        student_count_res = supabase_admin.table('students').select(
-            'id', count='exact').eq('module_code', module_code).execute()
+        # The remaining reads are independent, so they run concurrently
 
-        timetable_res = supabase_admin.table('class_timetable').select(
-            'day_of_week').eq('module_id', module_id).execute()
-
-        students_res = supabase_admin.table('students').select(
-            'id, full_name, student_number, attendance_records(count)'
-        ).eq('module_code', module_code).eq('attendance_records.status', 'present').execute()
-
-        processed_students = []
-        for student in students_res.data:
-            present_count = student['attendance_records'][0]['count'] if student['attendance_records'] else 0
-            absences_count = classes_held_so_far - present_count  # Calculate absences
-            mark_so_far = present_count * mark_per_class
-            remaining_classes = total_semester_classes - classes_held_so_far
-            max_potential_mark = mark_so_far + \
-                (remaining_classes * mark_per_class)
-
-            # CORRECTED: At risk means 16 or more absences (not based on potential mark)
-            is_at_risk = absences_count >= 16
-
-            processed_students.append({
-                "full_name": student['full_name'],
-                "student_number": student['student_number'],
-                "is_at_risk": is_at_risk
-            })
+        # Absences and at-risk flags per student, computed in Postgres
+        students_future = APP_EXECUTOR.submit(
+            supabase_admin.rpc('dashboard_students', {
+                'p_module_id': module_id,
+                'p_module_code': module_code,
+                'p_classes_held': classes_held_so_far
+            }).execute)
 
         # FIXED QUERY: Use an inner join to prevent "Unknown Student" where possible
         # CRITICAL FIX: Added 'full_name' to the students selection
-        attendance_res = supabase_admin.table('attendance_records').select(
-            'student_id, status, created_at, students!inner(full_name, student_number)'
-        ).eq('module_id', module_id).execute()
-
-        pending_subs_res = supabase_admin.table('apology_submissions').select(
-            'id', count='exact').eq('status', 'Pending').execute()
+        attendance_future = APP_EXECUTOR.submit(
+            supabase_admin.table('attendance_records').select(
+                'student_id, status, created_at, students!inner(full_name, student_number)'
+            ).eq('module_id', module_id).execute)
+
+        pending_subs_future = APP_EXECUTOR.submit(
+            supabase_admin.table('apology_submissions').select(
+                'id', count='exact', head=True).eq('status', 'Pending').execute)
+
+        processed_students = [{
+            "full_name": student['full_name'],
+            "student_number": student['student_number'],
+            "is_at_risk": student['is_at_risk']
+        } for student in students_future.result().data]
+        attendance_res = attendance_future.result()
+        pending_subs_res = pending_subs_future.result()
 
         return jsonify({
             "module_id": module_id,
             "module_code": module_code,
-            "total_students": student_count_res.count,
+            "total_students": len(processed_students),
             "total_semester_classes": total_semester_classes,
             "classes_held_so_far": classes_held_so_far,
-            "class_days": [item['day_of_week'] for item in timetable_res.data],
+            # One entry per session, from the in-memory timetable
+            "class_days": [day for day, sessions in timetable_by_day.items()
+                           for _, _, session_module_id, _ in sessions
+                           if session_module_id == module_id],
             "students": processed_students,
             "records": attendance_res.data or [],
             "pending_submissions_count": pending_subs_res.count
@@ -1304,7 +1925,7 @@ def api_create_campaign():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Missing token."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
@@ -1329,28 +1950,28 @@ def api_create_campaign():
 
         new_campaign_id = campaign_insert_res.data[0]['id']
 
-        for q in questions:
-            question_data = {
+        # All questions in one insert, then all of their options in another
+        if questions:
+            questions_res = supabase_admin.table('campaign_questions').insert([{
                 'campaign_id': new_campaign_id,
                 'question_text': q['text'],
-                'question_type': q['type']
-            }
-            if q['type'] == 'multiple_choice' and q.get('correct_answer'):
-                question_data['correct_answer'] = q['correct_answer']
-
-            question_insert_res = supabase_admin.table(
-                'campaign_questions').insert(question_data).execute()
-            new_question_id = question_insert_res.data[0]['id']
-
-            if q['type'] == 'multiple_choice' and q['options']:
-                options_to_insert = [
-                    {'question_id': new_question_id, 'option_text': opt} for opt in q['options']]
+                'question_type': q['type'],
+                'correct_answer': (q.get('correct_answer') or None) if q['type'] == 'multiple_choice' else None
+            } for q in questions]).execute()
+
+            options_to_insert = [
+                {'question_id': row['id'], 'option_text': opt}
+                for row, q in zip(questions_res.data, questions)
+                if q['type'] == 'multiple_choice' and q['options']
+                for opt in q['options']]
+            if options_to_insert:
                 supabase_admin.table('question_options').insert(
                     options_to_insert).execute()
 
-        send_campaign_emails(new_campaign_id)
+        # Sending runs in the background; the mail worker delivers the queued emails
+        APP_EXECUTOR.submit(send_campaign_emails, new_campaign_id)
 
-        return jsonify({"message": f"{title} created and emails sent successfully!"}), 201
+        return jsonify({"message": f"{title} created and emails are being sent!"}), 201
     except Exception as e:
         if 'new_campaign_id' in locals():
             supabase_admin.table('campaigns').update(
@@ -1371,27 +1992,22 @@ def api_get_campaign_for_student():
         campaign_id = token_data['campaign_id']
         student_id = token_data['student_id']
 
-        existing_response = supabase_admin.table('campaign_participants').select(
-            'id').eq('campaign_id', campaign_id).eq('student_id', student_id).execute()
-        if existing_response.data:
-            return jsonify({"error": "You have already responded to this campaign. Thank you!"}), 409
-
+        # Campaign, questions with their options, and this student's participation
+        # row (if any) in a single embedded query
         campaign_res = supabase_admin.table('campaigns').select(
-            '*').eq('id', campaign_id).single().execute()
-        if not campaign_res.data:
+            'title, incentive, campaign_questions(id, question_text, question_type, question_options(option_text)), campaign_participants(id)'
+        ).eq('id', campaign_id).eq('campaign_participants.student_id', student_id).maybe_single().execute()
+        if not campaign_res or not campaign_res.data:
             return jsonify({"error": "Campaign not found."}), 404
 
         campaign = campaign_res.data
-
-        questions_res = supabase_admin.table('campaign_questions').select(
-            '*').eq('campaign_id', campaign_id).execute()
-        campaign['campaign_questions'] = questions_res.data
+        if campaign.pop('campaign_participants'):
+            return jsonify({"error": "You have already responded to this campaign. Thank you!"}), 409
 
         for q in campaign['campaign_questions']:
+            options = q.pop('question_options')
             if q['question_type'] == 'multiple_choice':
-                options_res = supabase_admin.table('question_options').select(
-                    'option_text').eq('question_id', q['id']).execute()
-                q['options'] = [opt['option_text'] for opt in options_res.data]
+                q['options'] = [opt['option_text'] for opt in options]
 
         return jsonify({"campaign": campaign}), 200
     except Exception as e:
@@ -1411,11 +2027,6 @@ def api_submit_campaign_response():
         campaign_id = token_data['campaign_id']
         student_id = token_data['student_id']
 
-        existing_response = supabase_admin.table('campaign_participants').select(
-            'id').eq('campaign_id', campaign_id).eq('student_id', student_id).execute()
-        if existing_response.data:
-            return jsonify({"error": "You have already submitted a response."}), 409
-
         score = None
         campaign_type_res = supabase_admin.table('campaigns').select(
             'campaign_type').eq('id', campaign_id).single().execute()
@@ -1432,17 +2043,16 @@ def api_submit_campaign_response():
                 if correct_answer and student_answer == correct_answer:
                     score += 1
 
-        supabase_admin.table('campaign_participants').insert({
-            'campaign_id': campaign_id,
-            'student_id': student_id
-        }).execute()
-
-        supabase_admin.table('campaign_responses').insert({
-            'campaign_id': campaign_id,
-            'student_id': student_id,
-            'response_data': responses,
-            'score': score
+        # Participation and response are recorded atomically; false means the
+        # student had already responded
+        recorded = supabase_admin.rpc('submit_campaign_response', {
+            'p_campaign_id': campaign_id,
+            'p_student_id': student_id,
+            'p_responses': responses,
+            'p_score': score
         }).execute()
+        if not recorded.data:
+            return jsonify({"error": "You have already submitted a response."}), 409
 
         return jsonify({"message": "Your response has been recorded successfully. You are now eligible for the incentive!"}), 201
     except Exception as e:
@@ -1456,7 +2066,7 @@ def api_get_campaigns():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Missing token."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
@@ -1477,7 +2087,7 @@ def api_pick_winners():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Missing token."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
@@ -1485,8 +2095,8 @@ def api_pick_winners():
         campaign_id = data.get('campaign_id')
 
         campaign_res = supabase_admin.table('campaigns').select(
-            '*').eq('id', campaign_id).eq('lecturer_id', user_res.user.id).single().execute()
-        if not campaign_res.data:
+            'title, incentive').eq('id', campaign_id).eq('lecturer_id', user_res.user.id).maybe_single().execute()
+        if not campaign_res or not campaign_res.data:
             return jsonify({"error": "Campaign not found."}), 404
 
         campaign = campaign_res.data
@@ -1495,27 +2105,38 @@ def api_pick_winners():
         if not participants_res.data:
             return jsonify({"error": "No students have participated yet."}), 400
 
-        num_winners = int(re.search(r'x(\d+)', campaign['incentive']).group(
-            1)) if re.search(r'x(\d+)', campaign['incentive']) else 1
+        match = WINNERS_PATTERN.search(campaign['incentive'])
+        num_winners = int(match.group(1)) if match else 1
         if len(participants_res.data) < num_winners:
             return jsonify({"error": f"Not enough participants to pick {num_winners} winners."}), 400
 
         winners = random.sample(participants_res.data, num_winners)
-
+        expires_on = (get_system_time().date() + timedelta(days=30)).isoformat()
+
+        # Every winner gets the same prize, so pick the templates and fill in the
+        # title once; '$' is escaped so the title is not re-read as a placeholder
+        subject_tpl, body_tpl, voucher_type = next(
+            (tpl for key, tpl in WINNER_TEMPLATES.items() if key in campaign['incentive']),
+            GENERIC_WINNER_TEMPLATE)
+        subject = subject_tpl.substitute()
+        body_tpl = Template(body_tpl.safe_substitute(
+            title=str(campaign['title']).replace('$', '$$')))
+
+        voucher_rows = []
+        notifications = []
         for winner in winners:
             student_id, student_name, student_email = winner['student_id'], winner[
                 'students']['full_name'], winner['students']['email']
+            body = body_tpl.substitute(student_name=student_name)
 
-            if "Assignment Extension" in campaign['incentive']:
-                subject, body, voucher_type = "🎉 Congratulations! You've won an Assignment Extension Voucher!", f"Hi {student_name},\n\nGreat news! For completing the '{campaign['title']}', you've been randomly selected to receive an Assignment Extension Voucher.\n\nThis voucher grants you a 24-hour extension on a single assignment. To redeem it, please forward this email to me when you submit.\n\nWell done and thank you for your participation!\nYour Lecturer", "Assignment Extension"
-            elif "WiFi Pass" in campaign['incentive']:
-                subject, body, voucher_type = "🎉 Congratulations! You've won a Staff WiFi Pass!", f"Hi {student_name},\n\nGreat news! For completing the '{campaign['title']}', you've been randomly selected to receive a one-month DUT Staff WiFi Pass.\n\nPlease see me after our next class to collect your pass.\n\nThank you for your valuable feedback!\nYour Lecturer", "Staff WiFi Pass"
-            else:
-                subject, body, voucher_type = "Congratulations! You're a campaign winner!", f"Hi {student_name}, You have won the prize for the '{campaign['title']}' campaign.", "Generic Prize"
+            notifications.append((student_email, subject, body))
+            voucher_rows.append({"student_id": student_id, "campaign_id": campaign_id,
+                                 "voucher_type": voucher_type, "expires_on": expires_on})
 
-            send_email(student_email, subject, body)
-            supabase_admin.table('vouchers').insert({"student_id": student_id, "campaign_id": campaign_id, "voucher_type": voucher_type, "expires_on": (
-                get_system_time().date() + timedelta(days=30)).isoformat()}).execute()
+        # Record every voucher in one insert, then hand the emails to the mail worker
+        supabase_admin.table('vouchers').insert(voucher_rows).execute()
+        for student_email, subject, body in notifications:
+            queue_email(student_email, subject, body)
 
         supabase_admin.table('campaigns').update(
             {'status': 'COMPLETED'}).eq('id', campaign_id).execute()
@@ -1536,7 +2157,7 @@ def api_backfill_all_students():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Authentication required."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
@@ -1552,11 +2173,11 @@ def api_backfill_all_students():
         module_code = module_res.data['module_code']
 
         # Get all students in this module
-        students_res = supabase_admin.table('students').select(
+        student_ids = [s['id'] for s in paged(lambda: supabase_admin.table('students').select(
             'id'
-        ).eq('module_code', module_code).execute()
+        ).eq('module_code', module_code).order('id'))]
 
-        if not students_res.data:
+        if not student_ids:
             return jsonify({"error": "No students found."}), 404
 
         # CRITICAL FIX: Only get lectures that have ALREADY HAPPENED
@@ -1568,33 +2189,27 @@ def api_backfill_all_students():
         if not lectures_res.data:
             return jsonify({"message": "No past lectures to backfill."}), 200
 
-        backfill_count = 0
-
-        for student in students_res.data:
-            student_id = student['id']
-
-            # For each PAST lecture, check if this student has ANY record
-            for lecture in lectures_res.data:
-                lecture_date = lecture['lecture_date']
-
-                # Check if a record already exists for this student on this date
-                existing_res = supabase_admin.table('attendance_records').select('id').eq(
-                    'student_id', student_id
-                ).eq('module_id', module_id).gte(
-                    'created_at', f"{lecture_date}T00:00:00"
-                ).lte(
-                    'created_at', f"{lecture_date}T23:59:59"
-                ).execute()
-
-                # If no record exists, create an absent record
-                if not existing_res.data:
-                    supabase_admin.table('attendance_records').insert({
-                        'student_id': student_id,
-                        'module_id': module_id,
-                        'status': 'absent',
-                        'created_at': f"{lecture_date}T17:00:00"
-                    }).execute()
-                    backfill_count += 1
+        lecture_dates = {lecture['lecture_date'] for lecture in lectures_res.data}
+
+        # Every (student, day) that already has ANY record for this module, in one scan
+        existing = {(r['student_id'], r['created_at'][:10]) for r in paged(
+            lambda: supabase_admin.table('attendance_records').select('id, student_id, created_at')
+            .eq('module_id', module_id)
+            .gte('created_at', f"{min(lecture_dates)}T00:00:00")
+            .lte('created_at', f"{max(lecture_dates)}T23:59:59")
+            .order('id'))}
+
+        # Create an absent record for each past lecture a student has no record for
+        missing = {(student_id, lecture_date) for student_id in student_ids
+                   for lecture_date in lecture_dates} - existing
+        if missing:
+            supabase_admin.table('attendance_records').insert([{
+                'student_id': student_id,
+                'module_id': module_id,
+                'status': 'absent',
+                'created_at': f"{lecture_date}T17:00:00"
+            } for student_id, lecture_date in sorted(missing)]).execute()
+        backfill_count = len(missing)
 
         return jsonify({
             "message": f"Backfill complete. Added {backfill_count} historical absence records for past classes only."
@@ -1614,6 +2229,8 @@ def api_backfill_all_students():
 def api_handle_logout():
     try:
         supabase_anon.auth.sign_out()
+        # Forget cached token lookups so a signed-out token stops working right away
+        get_user_cached.cache_clear()
         return jsonify({"message": "Successfully logged out"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -1626,13 +2243,31 @@ def api_run_daily_check():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Authentication required."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
+        if not user_res.user:
+            return jsonify({"error": "Invalid token."}), 401
+
+        APP_EXECUTOR.submit(send_daily_absence_emails,
+                            get_system_time().date() - timedelta(days=1))
+        return jsonify({"message": "Daily check for yesterday started."}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/timetable-changed', methods=['POST'])
+def api_timetable_changed():
+    """Reloads the in-memory timetable after class_timetable was edited."""
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"error": "Authentication required."}), 401
+        token = auth_header.split(' ')[1]
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
-        send_daily_absence_emails(
-            target_date=get_system_time().date() - timedelta(days=1))
-        return jsonify({"message": "Daily check for yesterday completed."}), 200
+        load_timetable()
+        return jsonify({"message": "Timetable reloaded."}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1644,13 +2279,13 @@ def api_run_at_risk_check():
         if not auth_header or not auth_header.startswith('Bearer '):
             return jsonify({"error": "Authentication required."}), 401
         token = auth_header.split(' ')[1]
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
 
         lecturer_id = user_res.user.id
         module_res = supabase_admin.table('modules').select(
-            'id, module_code'
+            'id, module_code, lecturers(full_name)'
         ).eq('lecturer_id', lecturer_id).single().execute()
 
         if not module_res.data:
@@ -1659,133 +2294,86 @@ def api_run_at_risk_check():
         module_id = module_res.data['id']
         module_code = module_res.data['module_code']
 
-        students_res = supabase_admin.table('students').select(
-            'id, full_name, email'
-        ).eq('module_code', module_code).execute()
-
-        if not students_res.data:
-            return jsonify({"error": "No students found."}), 404
-
-        # Get schedule info
-        total_schedule_res = supabase_admin.table('lecture_schedules').select(
-            'id', count='exact'
-        ).eq('module_id', module_id).execute()
-        TOTAL_SEMESTER_CLASSES = total_schedule_res.count
+        # The students and absence stats lookups are independent, so they run concurrently
+        students_future = APP_EXECUTOR.submit(
+            supabase_admin.table('students').select(
+                'id, full_name, email'
+            ).eq('module_code', module_code).execute)
 
+        # Absences of each student past the first threshold and the schedule counts,
+        # aggregated in one RPC
         today = get_system_time().date()
-        held_schedule_res = supabase_admin.table('lecture_schedules').select(
-            'id', count='exact'
-        ).eq('module_id', module_id).lte('lecture_date', today.isoformat()).execute()
-        classes_held = held_schedule_res.count
+        stats_future = APP_EXECUTOR.submit(lambda: list(paged(
+            lambda: supabase_admin.rpc('get_at_risk_stats', {
+                'p_module_id': module_id, 'p_today': today.isoformat()
+            }).order('student_id'))))
 
-        MARK_PER_CLASS = 100 / TOTAL_SEMESTER_CLASSES
+        students_res = students_future.result()
+        stats = stats_future.result()
 
-        # BULK QUERY: Get ALL absences in one go
-        all_absences_res = supabase_admin.table('attendance_records').select(
-            'student_id'
-        ).eq('module_id', module_id).eq('status', 'absent').execute()
+        if not students_res.data:
+            return jsonify({"error": "No students found."}), 404
 
-        # Count absences per student in Python
-        from collections import Counter
-        absence_counts = Counter(record['student_id']
-                                 for record in all_absences_res.data)
+        absence_counts = {row['student_id']: row['absences'] for row in stats}
 
-        # Get lecturer name once
-        lecturer_res = supabase_admin.table('modules').select(
-            'lecturers(full_name)'
-        ).eq('id', module_id).single().execute()
+        # Only at-risk students have rows, so without any these go unused
+        TOTAL_SEMESTER_CLASSES = stats[0]['total_classes'] if stats else 0
+        classes_held = stats[0]['classes_held'] if stats else 0
+        if stats and TOTAL_SEMESTER_CLASSES <= 0:
+            return jsonify({"error": "No lectures are scheduled for this module, so marks cannot be calculated. Upload the module guide first."}), 409
 
         lecturer_name = "Your Lecturer"
-        if lecturer_res.data and lecturer_res.data.get('lecturers'):
-            lecturer_name = lecturer_res.data['lecturers']['full_name']
+        if module_res.data.get('lecturers'):
+            lecturer_name = module_res.data['lecturers']['full_name']
 
         emails_sent = 0
         at_risk_students = []
         email_errors = []
-
-        for student in students_res.data:
-            student_id = student['id']
+        # (student_name, total_absences, threshold) and (email, subject, body) per warning
+        pending = []
+
+        # Absences, threshold tier and current mark for every student in a few array passes
+        students = students_res.data
+        absences = np.fromiter((absence_counts.get(student['id'], 0) for student in students),
+                               dtype=np.int32, count=len(students))
+        tiers = np.select([absences >= 21, absences >= 18, absences >= 16],
+                          [21, 18, 16], default=0)
+        at_risk_indices = np.flatnonzero(tiers)
+        current_marks = (classes_held -
+                         absences[at_risk_indices]) / TOTAL_SEMESTER_CLASSES * 100
+
+        # Only one email per student, for the highest threshold they have reached
+        for i, current_mark in zip(at_risk_indices.tolist(), current_marks.tolist()):
+            student = students[i]
             student_name = student['full_name']
-            student_email = student['email']
-
-            # Get absence count from our bulk query results
-            total_absences = absence_counts.get(student_id, 0)
-
-            print(f"DEBUG: {student_name} has {total_absences} absences")
-
-            # Check thresholds
-            thresholds = [21, 18, 16]
-            email_sent = False
-
-            for threshold in thresholds:
-                if total_absences >= threshold and not email_sent:
-                    print(f"DEBUG: {student_name} meets threshold {threshold}")
-
-                    # Calculate current mark
-                    present_count = classes_held - total_absences
-                    current_mark = (
-                        present_count / TOTAL_SEMESTER_CLASSES) * 100
-
-                    # Determine email content based on threshold
-                    if threshold == 21:
-                        subject = f"CRITICAL: You are at risk of failing {module_code}"
-                        body = (
-                            f"Hi {student_name},\n\n"
-                            f"This is a critical notice regarding your enrollment in {module_code}.\n\n"
-                            f"You have missed {total_absences} classes, which means your current mark is {current_mark:.0f}% - below the 60% pass threshold. You are now at risk of failing this module.\n\n"
-                            "This is an urgent situation that requires immediate action. I need you to:\n\n"
-                            "1. Contact me immediately to discuss your situation\n"
-                            "2. Attend every remaining class without exception\n"
-                            "3. Consider whether you may qualify for special consideration (illness, family emergency, etc.)\n\n"
-                            "If you're facing serious challenges that have affected your attendance, you may be able to submit a special consideration request through the system. Please reach out to me or Student Counselling (counselling@dut.ac.za) for guidance.\n\n"
-                            "I want to help you succeed, but you must take action now.\n\n"
-                            f"Urgent regards,\n{lecturer_name}"
-                        )
-                    elif threshold == 18:
-                        subject = f"Urgent: Your attendance in {module_code} needs attention"
-                        body = (
-                            f"Hi {student_name},\n\n"
-                            f"This is an important message about your progress in {module_code}.\n\n"
-                            f"You have now missed {total_absences} classes, which means your current mark is {current_mark:.0f}%. You are very close to falling below the 60% pass threshold.\n\n"
-                            "If you miss just 3 more classes, you will fail the module. I'm reaching out because I want to help you avoid this outcome.\n\n"
-                            "Please consider this a serious warning. I strongly encourage you to:\n"
-                            "- Attend all remaining classes\n"
-                            "- Meet with me to discuss any challenges you're facing\n"
-                            "- Reach out to Student Counselling if you need support: counselling@dut.ac.za\n\n"
-                            "It's not too late to turn things around, but you need to act now.\n\n"
-                            f"Sincerely,\n{lecturer_name}"
-                        )
-                    else:  # 16 absences
-                        subject = f"Check-in: We miss you in {module_code}"
-                        body = (
-                            f"Hi {student_name},\n\n"
-                            f"I wanted to reach out because I've noticed you've missed {total_absences} classes in {module_code} so far this semester.\n\n"
-                            f"Your current attendance puts you at {current_mark:.0f}% for the module. You've dropped slightly below our 70% target, but you're still above the 60% pass threshold. However, if you miss 5 more classes, your mark will drop below 60% and you'll be at risk of failing.\n\n"
-                            "I believe in your ability to succeed, and I'm here to support you. If there's anything affecting your attendance - whether it's personal challenges, academic struggles, or anything else - please don't hesitate to reach out to me.\n\n"
-                            "You can also contact DUT Student Counselling confidentially at: counselling@dut.ac.za\n\n"
-                            "Let's work together to get you back on track.\n\n"
-                            f"Best regards,\n{lecturer_name}"
-                        )
-
-                    # Attempt to send email
-                    try:
-                        email_result = send_email(student_email, subject, body)
-                        if email_result:
-                            emails_sent += 1
-                            at_risk_students.append(
-                                f"{student_name} ({total_absences} absences - {threshold} threshold)")
-                            email_sent = True
-                            print(f"SUCCESS: Email sent to {student_name}")
-                        else:
-                            email_errors.append(
-                                f"{student_name}: Email send failed")
-                            print(f"FAILED: Email to {student_name} failed")
-                    except Exception as e:
-                        email_errors.append(f"{student_name}: {str(e)}")
-                        print(
-                            f"ERROR: Email to {student_name} threw exception: {e}")
-
-                    break  # Only send one email per student
+            total_absences = int(absences[i])
+            threshold = int(tiers[i])
+            # Debug output is formatted only when debug logging is on
+            app.logger.debug("%s has %d absences, meets threshold %d",
+                             student_name, total_absences, threshold)
+
+            # Email content for the threshold, from the shared templates
+            subject_tpl, body_tpl = AT_RISK_TEMPLATES[threshold]
+            subject = subject_tpl.substitute(module_code=module_code)
+            body = body_tpl.substitute(
+                student_name=student_name, total_absences=total_absences,
+                module_code=module_code, current_mark=f"{current_mark:.0f}",
+                lecturer_name=lecturer_name)
+
+            pending.append(((student_name, total_absences, threshold),
+                            (student['email'], subject, body)))
+
+        # SMTP is latency-bound, so the warnings go out concurrently
+        results = send_emails_concurrently([message for _, message in pending])
+        for ((student_name, total_absences, threshold), _), email_result in zip(pending, results):
+            if email_result:
+                emails_sent += 1
+                at_risk_students.append(
+                    f"{student_name} ({total_absences} absences - {threshold} threshold)")
+                print(f"SUCCESS: Email sent to {student_name}")
+            else:
+                email_errors.append(f"{student_name}: Email send failed")
+                print(f"FAILED: Email to {student_name} failed")
 
         result_message = f"At-risk check completed. Sent {emails_sent} warning email(s)."
         if email_errors:
@@ -1813,7 +2401,7 @@ def api_system_time_control():
         return jsonify({"error": "Authentication required."}), 401
     token = auth_header.split(' ')[1]
     try:
-        user_res = supabase_anon.auth.get_user(token)
+        user_res = get_user_cached(token)
         if not user_res.user:
             return jsonify({"error": "Invalid token."}), 401
     except Exception:
@@ -1838,116 +2426,200 @@ def api_system_time_control():
         if sim_dt_str:
             system_time_settings['simulated_start_time'] = datetime.fromisoformat(
                 sim_dt_str)
-            system_time_settings['real_time_at_set'] = datetime.now(
-                timezone('Africa/Johannesburg'))
+            system_time_settings['real_time_at_set'] = datetime.now(SAST)
 
-        system_time_settings['last_checked'] = datetime.now(
-            timezone('Africa/Johannesburg'))
+        # Drop the cached settings row so the next lookup sees the new values
+        _fetch_system_settings.cache_clear()
+        reschedule_after_clock_change()
         return jsonify({"message": "System time settings updated."}), 200
 
 # AUTOMATED SCHEDULER LOGIC (TIME MACHINE AWARE)
 
 
 # Global state to track when jobs were last run to prevent duplicates
-last_run_times = {"absentee_check": {},
+last_run_times = {"absentee_check": {}, "daily_absence_emails": {},
                   "weekly_summary": None, "campaigns": None}
 
+# The unified job ticks every minute while there is work around, and backs off
+# (doubling up to a flat 15 minutes) after consecutive ticks that found nothing to
+# do. The back-off is not tied to the timetable: absentees are marked by separate
+# one-shot mark_absentees jobs at each class end, so only the weekly summary can
+# be delayed, by at most SCHEDULER_MAX_INTERVAL.
+SCHEDULER_BASE_INTERVAL = 60
+SCHEDULER_MAX_INTERVAL = 15 * 60
+_noop_streak = 0
+_scheduler_interval = SCHEDULER_BASE_INTERVAL
+
+# Absentees are marked for classes that ended at most this long ago
+ABSENTEE_CHECK_WINDOW = timedelta(minutes=5)
+
+
+def _set_scheduler_interval(seconds):
+    global _scheduler_interval
+    if seconds != _scheduler_interval:
+        _scheduler_interval = seconds
+        scheduler.reschedule_job(
+            'unified_scheduler_job', trigger='interval', seconds=seconds)
+
+
+def reschedule_after_clock_change():
+    """Re-plans scheduled work after the simulated clock moved."""
+    global _noop_streak
+    _noop_streak = 0
+    _set_scheduler_interval(SCHEDULER_BASE_INTERVAL)
+    schedule_next_absentee_check()
+
+
+def _schedule_next_tick(did_work):
+    """Idle ticks double the delay until the next one, up to SCHEDULER_MAX_INTERVAL."""
+    global _noop_streak
+    _noop_streak = 0 if did_work else _noop_streak + 1
+    _set_scheduler_interval(min(SCHEDULER_BASE_INTERVAL * 2 ** min(_noop_streak, 4),
+                                SCHEDULER_MAX_INTERVAL))
+
+
+def _next_class_end(now):
+    """The first class end after `now` in the coming week, or None without a timetable."""
+    for days_ahead in range(8):
+        day = now.date() + timedelta(days=days_ahead)
+        for end_time, *_ in timetable_by_day.get(day.isoweekday(), []):
+            class_end = datetime.combine(day, end_time, tzinfo=now.tzinfo)
+            if class_end > now:
+                return class_end
+    return None
+
+
+def schedule_next_absentee_check():
+    """Schedules mark_absentees() to run once, right as the next class ends."""
+    now = get_system_time()
+    class_end = _next_class_end(now)
+    if class_end is None:
+        if scheduler.get_job('mark_absentees'):
+            scheduler.remove_job('mark_absentees')
+        return
+
+    # The simulated clock runs at real speed, so the gap is the same in real time
+    run_at = datetime.now(SAST) + (class_end - now)
+    scheduler.add_job(mark_absentees, 'date', run_date=run_at, id='mark_absentees',
+                      replace_existing=True,
+                      misfire_grace_time=int(ABSENTEE_CHECK_WINDOW.total_seconds()))
+    print(
+        f"SCHEDULER: Next absentee check at simulated time {class_end.strftime('%Y-%m-%d %H:%M')}")
+
+
+def mark_absentees():
+    """Marks absentees for every class that just ended, then schedules the next check."""
+    with app.app_context():
+        now = get_system_time()
+        today = now.date()
+        today_str = today.isoformat()
+
+        try:
+            for end_time, session_id, module_id, module_code in timetable_by_day.get(now.isoweekday(), []):
+                class_end_datetime = datetime.combine(
+                    today, end_time, tzinfo=now.tzinfo)
+                if not timedelta(0) <= now - class_end_datetime <= ABSENTEE_CHECK_WINDOW:
+                    continue
+
+                session_id_for_day = f"{today_str}_{session_id}"
+                if last_run_times["absentee_check"].get(session_id_for_day) == True:
+                    continue
+                print(f"--> TRIGGER: Marking absentees for {module_code}")
+
+                # Enrolled students with no record today, found by an anti-join in Postgres
+                absent_ids = {row['student_id'] for row in paged(
+                    lambda: supabase_admin.rpc('get_absent_students', {
+                        'p_module_id': module_id,
+                        'p_day_start': f"{today_str}T00:00:00",
+                        'p_day_end': f"{today_str}T23:59:59"
+                    }).order('student_id'))}
+
+                if absent_ids:
+                    absent_records = []
+                    for student_id in absent_ids:
+                        absent_records.append({
+                            'student_id': student_id,
+                            'module_id': module_id,
+                            'status': 'absent',
+                            'created_at': class_end_datetime.isoformat()
+                        })
+
+                    supabase_admin.table('attendance_records').insert(
+                        absent_records).execute()
+                    print(
+                        f"Marked {len(absent_ids)} students as absent for {module_code}.")
+
+                    # Check the absent students for at-risk warnings
+                    send_at_risk_warnings_for_module(module_id, absent_ids)
+
+                    # Only this module's absentees, and only once per day even if
+                    # the module has several classes
+                    emails_key = f"{module_id}_{today_str}"
+                    if last_run_times["daily_absence_emails"].get(emails_key) != True:
+                        send_daily_absence_emails(
+                            target_date=today, module_ids=[module_id])
+                        last_run_times["daily_absence_emails"][emails_key] = True
+
+                last_run_times["absentee_check"][session_id_for_day] = True
+        except Exception as e:
+            print(f"--- ERROR in mark_absentees: {str(e)} ---")
+        finally:
+            schedule_next_absentee_check()
+
 
 def unified_scheduler_job():
     """
-    A single, smart scheduler job that runs every minute and checks if any
-    of the system's automated tasks should be triggered.
+    A single, smart scheduler job that runs every minute (less often when idle)
+    and checks if any of the system's periodic tasks should be triggered.
+    Absentees are marked separately, by mark_absentees() at each class end.
     """
     with app.app_context():
         now = get_system_time()
         today_str = now.date().isoformat()
+        did_work = False
 
         print(
             f"SCHEDULER (Unified): Tick at simulated time {now.strftime('%Y-%m-%d %H:%M:%S')}")
 
-        # 1. Check for Finished Classes to Mark Absentees
-        try:
-            sessions_res = supabase_admin.table('class_timetable').select(
-                '*, modules(module_code)').eq('day_of_week', now.weekday() + 1).execute()
-            if sessions_res.data:
-                for session in sessions_res.data:
-                    end_time = datetime.strptime(
-                        session['end_time'], '%H:%M:%S').time()
-                    class_end_datetime = now.replace(
-                        hour=end_time.hour, minute=end_time.minute, second=0, microsecond=0)
-
-                    if now > class_end_datetime and (now - class_end_datetime).seconds <= 300:
-                        session_id_for_day = f"{today_str}_{session['id']}"
-                        if last_run_times["absentee_check"].get(session_id_for_day) != True:
-                            print(
-                                f"--> TRIGGER: Marking absentees for {session['modules']['module_code']}")
-
-                            module_id = session['module_id']
-                            module_code = session['modules']['module_code']
-
-                            enrolled_res = supabase_admin.table('students').select(
-                                'id').eq('module_code', module_code).execute()
-                            if not enrolled_res.data:
-                                continue
-                            enrolled_ids = {s['id'] for s in enrolled_res.data}
-
-                            recorded_res = supabase_admin.table('attendance_records').select('student_id') \
-                                .eq('module_id', module_id) \
-                                .gte('created_at', f"{today_str}T00:00:00") \
-                                .lte('created_at', f"{today_str}T23:59:59") \
-                                .execute()
-                            recorded_ids = {r['student_id']
-                                            for r in recorded_res.data}
-
-                            absent_ids = enrolled_ids - recorded_ids
-
-                            if absent_ids:
-                                absent_records = []
-                                for student_id in absent_ids:
-                                    absent_records.append({
-                                        'student_id': student_id,
-                                        'module_id': module_id,
-                                        'status': 'absent',
-                                        'created_at': class_end_datetime.isoformat()
-                                    })
-
-                                supabase_admin.table('attendance_records').insert(
-                                    absent_records).execute()
-                                print(
-                                    f"Marked {len(absent_ids)} students as absent for {module_code}.")
-
-                                # Check each absent student for at-risk warnings
-                                for student_id in absent_ids:
-                                    check_and_send_at_risk_warning(
-                                        student_id, module_id)
-
-                                send_daily_absence_emails(
-                                    target_date=now.date())
-
-                            last_run_times["absentee_check"][session_id_for_day] = True
-        except Exception as e:
-            print(
-                f"--- ERROR in unified scheduler (absentee check): {str(e)} ---")
-
-        # 2. Check for Weekly Summaries (Sundays after 6 PM)
+        # Check for Weekly Summaries (Sundays after 6 PM)
         try:
             if now.weekday() == 6 and now.hour >= 18:
                 if last_run_times["weekly_summary"] != today_str:
                     print("--> TRIGGER: Sending weekly summary emails...")
                     send_weekly_summary_emails()
                     last_run_times["weekly_summary"] = today_str
+                    did_work = True
         except Exception as e:
             print(
                 f"--- ERROR in unified scheduler (weekly summary): {str(e)} ---")
 
+        try:
+            _schedule_next_tick(did_work)
+        except Exception as e:
+            print(
+                f"--- ERROR in unified scheduler (rescheduling): {str(e)} ---")
+
 
 # Initialize and Start Scheduler
-scheduler = BackgroundScheduler(timezone='Africa/Johannesburg')
+scheduler = BackgroundScheduler(timezone=SAST)
 scheduler.add_job(unified_scheduler_job, 'interval',
-                  minutes=1, id='unified_scheduler_job')
+                  seconds=SCHEDULER_BASE_INTERVAL, id='unified_scheduler_job')
+scheduler.add_job(refresh_lecturer_cache, 'interval', days=1,
+                  next_run_time=datetime.now(SAST), id='refresh_lecturer_cache')
+# Hourly reload, so a failed or missed load does not leave attendance closed for good
+scheduler.add_job(load_timetable, 'interval', hours=1, id='reload_timetable')
 scheduler.start()
 atexit.register(lambda: scheduler.shutdown())
 
+try:
+    with_retries(lambda: load_timetable() or True)
+except Exception as e:
+    print(f"--- ERROR loading the class timetable: {str(e)} ---")
+
+# Clock changes re-plan scheduler jobs, so only follow them once the scheduler exists
+threading.Thread(target=_run_settings_listener,
+                 name='settings-listener', daemon=True).start()
+
 if __name__ == '__main__':
     print("--- Running one-time attendance backfill check ---")
     backfill_missed_attendance()
@@ -0,0 +1,25 @@
+-- Past lectures that have no attendance records at all on their lecture date,
+-- i.e. days the server was offline. Used by backfill_missed_attendance() so the
+-- check is one query instead of one count query per past lecture.
+create or replace function public.lectures_missing_attendance(p_before date)
+returns table (
+    module_id lecture_schedules.module_id%type,
+    lecture_date lecture_schedules.lecture_date%type,
+    module_code modules.module_code%type
+)
+language sql
+stable
+as $$
+    select ls.module_id, ls.lecture_date, m.module_code
+    from lecture_schedules ls
+    join modules m on m.id = ls.module_id
+    where ls.lecture_date < p_before
+      and not exists (
+          select 1
+          from attendance_records ar
+          where ar.module_id = ls.module_id
+            and ar.created_at >= ls.lecture_date::timestamp
+            and ar.created_at <= ls.lecture_date::timestamp + interval '23:59:59'
+      )
+    order by ls.lecture_date;
+$$;
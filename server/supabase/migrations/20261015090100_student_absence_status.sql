@@ -0,0 +1,23 @@
+-- One row per (student, module they are enrolled in) with everything
+-- check_and_send_at_risk_warning() needs: the absence count, the warning
+-- levels already sent and the student's contact details.
+-- security_invoker keeps the students RLS policies in force for API callers.
+create or replace view public.student_absence_status
+with (security_invoker = true) as
+select
+    s.id as student_id,
+    m.id as module_id,
+    count(ar.id) filter (where ar.status = 'absent') as total_absences,
+    coalesce(
+        (select array_agg(w.warning_level)
+         from at_risk_warnings w
+         where w.student_id = s.id and w.module_id = m.id),
+        '{}'
+    ) as warnings_sent,
+    s.full_name as student_name,
+    s.email as student_email,
+    s.module_code
+from students s
+join modules m on m.module_code = s.module_code
+left join attendance_records ar on ar.student_id = s.id and ar.module_id = m.id
+group by s.id, m.id;
@@ -0,0 +1,27 @@
+-- Per-student present counts for one module over a date range, for the weekly
+-- summary emails. Returns one row per student instead of every attendance row.
+create or replace function public.weekly_attendance_summary(
+    p_module_id attendance_records.module_id%type,
+    p_start timestamp,
+    p_end timestamp
+)
+returns table (
+    student_id students.id%type,
+    present_count bigint,
+    full_name students.full_name%type,
+    email students.email%type
+)
+language sql
+stable
+as $$
+    select ar.student_id,
+           count(*) filter (where ar.status = 'present'),
+           s.full_name,
+           s.email
+    from attendance_records ar
+    join students s on s.id = ar.student_id
+    where ar.module_id = p_module_id
+      and ar.created_at >= p_start
+      and ar.created_at <= p_end
+    group by ar.student_id, s.full_name, s.email;
+$$;
@@ -0,0 +1,19 @@
+-- An apology submission with the student's contact details and their module's
+-- lecturer, so send_decision_email() builds the email from one query instead of
+-- a submission lookup followed by a module/lecturer lookup.
+-- security_invoker keeps the underlying RLS policies in force for API callers.
+create or replace view public.apology_submission_details
+with (security_invoker = true) as
+select
+    a.id,
+    a.assessment_name,
+    a.status,
+    a.decision_reason,
+    s.full_name as student_name,
+    s.email as student_email,
+    s.module_code,
+    l.full_name as lecturer_name
+from apology_submissions a
+join students s on s.id = a.student_id
+left join modules m on m.module_code = s.module_code
+left join lecturers l on l.id = m.lecturer_id;
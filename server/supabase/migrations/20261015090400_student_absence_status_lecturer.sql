@@ -0,0 +1,24 @@
+-- Adds the module's lecturer to student_absence_status so at-risk warnings
+-- no longer need a separate lecturer lookup. New columns go last, as
+-- create or replace view requires.
+create or replace view public.student_absence_status
+with (security_invoker = true) as
+select
+    s.id as student_id,
+    m.id as module_id,
+    count(ar.id) filter (where ar.status = 'absent') as total_absences,
+    coalesce(
+        (select array_agg(w.warning_level)
+         from at_risk_warnings w
+         where w.student_id = s.id and w.module_id = m.id),
+        '{}'
+    ) as warnings_sent,
+    s.full_name as student_name,
+    s.email as student_email,
+    s.module_code,
+    l.full_name as lecturer_name
+from students s
+join modules m on m.module_code = s.module_code
+left join lecturers l on l.id = m.lecturer_id
+left join attendance_records ar on ar.student_id = s.id and ar.module_id = m.id
+group by s.id, m.id, l.full_name;
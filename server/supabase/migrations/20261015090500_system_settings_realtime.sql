@@ -0,0 +1,3 @@
+-- Publish system_settings changes over Supabase Realtime so the server can
+-- follow time-machine updates instead of polling the table.
+alter publication supabase_realtime add table public.system_settings;
@@ -0,0 +1,32 @@
+-- One row per student enrolled in a module with their absences so far and
+-- whether they are at risk (16 or more absences), for the lecturer dashboard.
+-- Replaces shipping each student's attendance to the server to count there.
+create or replace function public.dashboard_students(
+    p_module_id modules.id%type,
+    p_module_code students.module_code%type,
+    p_classes_held integer
+)
+returns table (
+    full_name students.full_name%type,
+    student_number students.student_number%type,
+    absences integer,
+    is_at_risk boolean
+)
+language sql
+stable
+as $$
+    select s.full_name,
+           s.student_number,
+           absences,
+           absences >= 16
+    from students s
+    cross join lateral (
+        select p_classes_held - count(*)::integer as absences
+        from attendance_records ar
+        where ar.student_id = s.id
+          and ar.module_id = p_module_id
+          and ar.status = 'present'
+    ) counts
+    where s.module_code = p_module_code
+    order by s.full_name;
+$$;
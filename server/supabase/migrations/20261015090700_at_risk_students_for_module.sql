@@ -0,0 +1,15 @@
+-- Absence status rows for every student in a module who has reached the first
+-- at-risk threshold, so the absentee check can fetch all candidates for a
+-- class in one call instead of querying student by student.
+create or replace function public.at_risk_students_for_module(
+    p_module_id modules.id%type
+)
+returns setof public.student_absence_status
+language sql
+stable
+as $$
+    select *
+    from student_absence_status
+    where module_id = p_module_id
+      and total_absences >= 16;
+$$;
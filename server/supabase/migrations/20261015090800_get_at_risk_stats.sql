@@ -0,0 +1,31 @@
+-- Absence counts for every student with at least one absence in a module, along
+-- with the module's total and already-held lecture counts, for the lecturer's
+-- manual at-risk check. Replaces pulling every absence row to count in Python.
+create or replace function public.get_at_risk_stats(
+    p_module_id modules.id%type,
+    p_today date
+)
+returns table (
+    student_id attendance_records.student_id%type,
+    absences bigint,
+    classes_held bigint,
+    total_classes bigint
+)
+language sql
+stable
+as $$
+    select ar.student_id,
+           count(*),
+           schedule.classes_held,
+           schedule.total_classes
+    from attendance_records ar
+    cross join lateral (
+        select count(*) filter (where ls.lecture_date <= p_today) as classes_held,
+               count(*) as total_classes
+        from lecture_schedules ls
+        where ls.module_id = p_module_id
+    ) schedule
+    where ar.module_id = p_module_id
+      and ar.status = 'absent'
+    group by ar.student_id, schedule.classes_held, schedule.total_classes;
+$$;
@@ -0,0 +1,34 @@
+-- Records a student's campaign participation and their response together, in one
+-- transaction, so a failure can no longer leave a participant without a response.
+-- Returns false (and records nothing) if the student has already responded.
+create or replace function public.submit_campaign_response(
+    p_campaign_id campaign_participants.campaign_id%type,
+    p_student_id campaign_participants.student_id%type,
+    p_responses campaign_responses.response_data%type,
+    p_score campaign_responses.score%type
+)
+returns boolean
+language plpgsql
+as $$
+begin
+    -- Serialise concurrent submissions from the same student for the same campaign
+    perform pg_advisory_xact_lock(hashtext(p_campaign_id::text || ':' || p_student_id::text));
+
+    if exists (
+        select 1
+        from campaign_participants
+        where campaign_id = p_campaign_id
+          and student_id = p_student_id
+    ) then
+        return false;
+    end if;
+
+    insert into campaign_participants (campaign_id, student_id)
+    values (p_campaign_id, p_student_id);
+
+    insert into campaign_responses (campaign_id, student_id, response_data, score)
+    values (p_campaign_id, p_student_id, p_responses, p_score);
+
+    return true;
+end;
+$$;
@@ -0,0 +1,27 @@
+-- Students enrolled in a module with no attendance record for it between the
+-- given bounds, for marking absentees when a class ends. Replaces pulling every
+-- enrolled student and every recorded row to subtract them in Python.
+create or replace function public.get_absent_students(
+    p_module_id modules.id%type,
+    p_day_start timestamp,
+    p_day_end timestamp
+)
+returns table (
+    student_id students.id%type
+)
+language sql
+stable
+as $$
+    select s.id
+    from students s
+    join modules m on m.module_code = s.module_code
+    where m.id = p_module_id
+      and not exists (
+          select 1
+          from attendance_records ar
+          where ar.student_id = s.id
+            and ar.module_id = p_module_id
+            and ar.created_at >= p_day_start
+            and ar.created_at <= p_day_end
+      );
+$$;
@@ -0,0 +1,22 @@
+-- Indexes for the filters the server runs most: attendance by module and day or
+-- status, attendance and warnings per student and module (student_absence_status,
+-- get_absent_students), enrolment by module code, lectures by module and date,
+-- and campaign participation checks. Plain create index rather than concurrently,
+-- since migrations run inside a transaction.
+create index if not exists attendance_records_module_status_created_idx
+    on public.attendance_records (module_id, status, created_at);
+
+create index if not exists attendance_records_student_module_idx
+    on public.attendance_records (student_id, module_id);
+
+create index if not exists at_risk_warnings_student_module_idx
+    on public.at_risk_warnings (student_id, module_id);
+
+create index if not exists students_module_code_idx
+    on public.students (module_code);
+
+create index if not exists lecture_schedules_module_date_idx
+    on public.lecture_schedules (module_id, lecture_date);
+
+create index if not exists campaign_participants_campaign_student_idx
+    on public.campaign_participants (campaign_id, student_id);